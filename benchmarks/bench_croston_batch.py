@@ -0,0 +1,26 @@
+import sys
+import os
+import time
+import numpy as np
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+from croston.croston import fit_croston, fit_croston_batch
+from bench_croston_fit import intermittent_series
+
+def in_sample_mse(series, fits):
+    return np.array([np.mean((s - fit['croston_fittedvalues']) ** 2) for s, fit in zip(series, fits)])
+
+if __name__ == '__main__':
+    series = intermittent_series(1000, 2000)
+    # Compile once outside of the timings
+    fit_croston_batch(series[:2], 1)
+    for variant in ['original', 'sba', 'sbj']:
+        for number_parameters in [1, 2]:
+            tic = time.perf_counter()
+            serial = [fit_croston(s, 1, variant, number_parameters) for s in series]
+            t_serial = time.perf_counter() - tic
+            tic = time.perf_counter()
+            batch = fit_croston_batch(series, 1, variant, number_parameters)
+            t_batch = time.perf_counter() - tic
+            ratio = in_sample_mse(series, batch) / in_sample_mse(series, serial)
+            print(f"{variant}, {number_parameters} parameter(s): {len(series)} series, minimize {t_serial:.2f}s, batch {t_batch:.2f}s, "
+                  f"batch/minimize in-sample MSE median {np.median(ratio):.4f}, max {ratio.max():.4f}")
@@ -0,0 +1,84 @@
+import sys
+import os
+import time
+import numpy as np
+from scipy.optimize import minimize
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+from croston import croston, _kernels
+from croston.croston import fit_croston
+from prediction import prediction
+from prediction.prediction import Croston
+
+def _croston_object_arrays(alpha, input_series, croston_variant, epsilon=1e-7):
+    # Reference copy of the former in-sample fit on object arrays
+    non_zero_demand = np.where(input_series != 0)[0]
+    k = len(non_zero_demand)
+    z = input_series[non_zero_demand]
+    x = np.concatenate([[non_zero_demand[0]], np.diff(non_zero_demand)])
+    zfit = np.array([None] * k)
+    xfit = np.array([None] * k)
+    zfit[0], xfit[0] = z[0], np.mean(x)
+    a_demand, a_interval = alpha[0], alpha[-1]
+    if croston_variant == "sba":
+        correction_factor = 1 - (a_interval / 2)
+    elif croston_variant == "sbj":
+        correction_factor = 1 - a_interval / (2 - a_interval + epsilon)
+    else:
+        correction_factor = 1
+    for i in range(1, k):
+        zfit[i] = zfit[i - 1] + a_demand * (z[i] - zfit[i - 1])
+        xfit[i] = xfit[i - 1] + a_interval * (x[i] - xfit[i - 1])
+    cc = correction_factor * zfit / (xfit + epsilon)
+    frc_in = np.zeros(len(input_series))
+    tv = np.concatenate([non_zero_demand, [len(input_series)]])
+    for i in range(k):
+        frc_in[tv[i]:min(tv[i + 1], len(input_series))] = cc[i]
+    E = input_series - frc_in
+    E = E[E != np.array(None)]
+    return np.mean(E ** 2)
+
+def fit_croston_object_arrays(series, croston_variant, number_parameters=2):
+    wopt = minimize(fun=_croston_object_arrays, x0=np.array([0.1] * number_parameters), method="Nelder-Mead", args=(series, croston_variant))
+    return np.minimum([1], np.maximum([0], wopt.x))
+
+def intermittent_series(n_series, length, seed=0):
+    rng = np.random.default_rng(seed)
+    occurrence = rng.random((n_series, length)) < rng.uniform(0.05, 0.5, (n_series, 1))
+    series = np.where(occurrence, rng.gamma(2.0, 5.0, (n_series, length)), 0.0)
+    series[:, 0] = 1.0
+    return series
+
+def per_series(function, series):
+    tic = time.perf_counter()
+    results = [function(s) for s in series]
+    return (time.perf_counter() - tic) / len(series) * 1000, results
+
+if __name__ == '__main__':
+    series = intermittent_series(20, 2000)
+    print(f"numba available: {_kernels.NUMBA_AVAILABLE}")
+    # Compile once outside of the timings
+    fit_croston(series[0], 1, 'original', 2)
+    Croston().fit(series[0], 'standard')
+    Croston().fit(series[0], 'tsb')
+
+    for variant in ['original', 'sba', 'sbj']:
+        # The object array fit is slow, so it only runs on the first 5 series
+        t_old, _ = per_series(lambda s: fit_croston_object_arrays(s, variant), series[:5])
+        t_new, _ = per_series(lambda s: fit_croston(s, 1, variant, 2), series)
+        croston.exponential_smoothing = _kernels._exponential_smoothing_vectorized
+        t_vec, _ = per_series(lambda s: fit_croston(s, 1, variant, 2), series)
+        croston.exponential_smoothing = _kernels.exponential_smoothing
+        print(f"fit_croston {variant}: object arrays {t_old:.1f} ms/series, kernel {t_new:.1f} ms/series, numpy fallback {t_vec:.1f} ms/series")
+
+    for method in ['standard', 'tsb']:
+        kernels = {
+            'pure python': (_kernels._croston_standard_loop, _kernels._croston_tsb_loop),
+            'numpy fallback': (_kernels._croston_standard_vectorized, _kernels._croston_tsb_vectorized),
+            'kernel': (_kernels.croston_standard, _kernels.croston_tsb),
+        }
+        timings = []
+        for name, (standard, tsb) in kernels.items():
+            prediction.croston_standard, prediction.croston_tsb = standard, tsb
+            t, _ = per_series(lambda s: Croston(alpha=0.3, beta=0.2).fit(s, method), series)
+            timings.append(f"{name} {t:.2f} ms/series")
+        print(f"Croston.fit {method}: " + ", ".join(timings))
@@ -0,0 +1,27 @@
+import sys
+import os
+import time
+import numpy as np
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+from gluonts.dataset.common import ListDataset
+from croston._predictor import CrostonForecastPredictor
+from bench_croston_fit import intermittent_series
+
+if __name__ == '__main__':
+    series = intermittent_series(400, 2000)
+    # A series without demand has no Croston model
+    series[7] = 0.0
+    dataset = ListDataset(
+        [{'start': '2021-01-01', 'target': s, 'item_id': f'plant_{i}'} for i, s in enumerate(series)],
+        freq='H',
+    )
+    results = {}
+    for num_workers in sorted({1, 2, 4, os.cpu_count() or 1}):
+        predictor = CrostonForecastPredictor(freq='H', prediction_length=24, variant='sba', num_workers=num_workers)
+        tic = time.perf_counter()
+        results[num_workers] = list(predictor.predict(dataset))
+        print(f"num_workers={num_workers}: {len(results[num_workers])} series, {time.perf_counter() - tic:.2f}s")
+    for forecasts in results.values():
+        assert [f.item_id for f in forecasts] == [f'plant_{i}' for i in range(len(series))]
+        assert all(np.array_equal(a.samples, b.samples, equal_nan=True) for a, b in zip(results[1], forecasts))
+    print(f"cpu_count={os.cpu_count()}")
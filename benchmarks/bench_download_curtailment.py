@@ -0,0 +1,34 @@
+import sys
+import os
+import time
+import urllib.error
+from datetime import datetime
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+from etl.extract import curtailment_windows, download_curtailment_windows
+from fixture_server import FixtureServer, synthetic_curtailment_export
+
+if __name__ == '__main__':
+    # Every request to the stand-in API takes 0.2s, like a slow remote export
+    windows = curtailment_windows(datetime(2022, 12, 31))
+    with FixtureServer(synthetic_curtailment_export(), latency=0.2) as server:
+        results = {}
+        for max_workers in [1, 4, 8]:
+            tic = time.perf_counter()
+            results[max_workers] = download_curtailment_windows(windows, max_workers=max_workers, base_url=server.url)
+            print(f"max_workers={max_workers}: {len(windows)} windows, {len(results[max_workers])} rows, {time.perf_counter() - tic:.2f}s")
+        assert all(results[1].equals(df) for df in results.values())
+    # Every 3rd request fails with a 503: the retries fetch all windows again
+    with FixtureServer(synthetic_curtailment_export(), fail_every=3) as server:
+        tic = time.perf_counter()
+        df = download_curtailment_windows(windows, max_workers=8, base_url=server.url)
+        print(f"fail_every=3: {server.requests} requests for {len(windows)} windows, {len(df)} rows, {time.perf_counter() - tic:.2f}s")
+        assert server.requests > len(windows)
+        assert df.equals(results[1])
+    # Without retries a failed window fails the whole download instead of leaving a gap
+    with FixtureServer(synthetic_curtailment_export(), fail_every=3) as server:
+        try:
+            download_curtailment_windows(windows, max_workers=8, base_url=server.url, retries=0)
+        except urllib.error.HTTPError as e:
+            print(f"retries=0: raised HTTP {e.code}")
+        else:
+            raise AssertionError("a failed window was skipped")
@@ -0,0 +1,36 @@
+import sys
+import os
+import time
+import numpy as np
+import pandas as pd
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+from etl.preprocess import etl_curtailment_data, get_mode_or_default
+from fixture_server import synthetic_curtailment_export
+
+def etl_curtailment_data_transform(df):
+    # Reference copy of the former per-group lambda and frame-wide fillna('Unknown')
+    df = df.drop(columns=['Einsatz-ID', 'Ursache', 'Entschädigungspflicht'])
+    df = df.dropna(subset=['Anlagenschlüssel', 'Start', 'Ende'])
+    mode_per_group = df.groupby('Anlagenschlüssel')['Stufe (%)'].transform(lambda x: get_mode_or_default(x, 30))
+    df['Stufe (%)'] = df['Stufe (%)'].fillna(mode_per_group)
+    df['Dauer (Min)'] = df['Dauer (Min)'].fillna(get_mode_or_default(df['Dauer (Min)'], 8))
+    df.fillna('Unknown', inplace=True)
+    df['Start'] = pd.to_datetime(df['Start'], errors='coerce')
+    df['Ende'] = pd.to_datetime(df['Ende'], errors='coerce')
+    df['Stufe (%)'] = df['Stufe (%)'].astype(np.int8)
+    df['ID'] = df['ID'].astype(str)
+    return df.rename(columns={'Dauer (Min)': 'Dauer', 'Stufe (%)': 'Stufe', 'Ort Engpass': 'Ort_Engpass', 'Anlagen-ID': 'Anlagen_ID', 'Abrechnungs-ID': 'Abrechnungs_ID'})
+
+if __name__ == '__main__':
+    df = synthetic_curtailment_export(n_rows=3_000_000, n_plants=50_000)
+    # Gaps like in the export: missing durations and areas
+    rng = np.random.default_rng(1)
+    df.loc[rng.random(len(df)) < 0.05, 'Dauer (Min)'] = np.nan
+    df.loc[rng.random(len(df)) < 0.05, 'Gebiet'] = None
+    for name, etl in [('groupby lambda', etl_curtailment_data_transform), ('value_counts', etl_curtailment_data)]:
+        tic = time.perf_counter()
+        df_etl = etl(df)
+        print(f"{name}: {len(df):,} rows, {df['Anlagenschlüssel'].nunique():,} plants, {time.perf_counter() - tic:.2f}s")
+        if name == 'groupby lambda':
+            df_old = df_etl
+    assert df_old.equals(df_etl)
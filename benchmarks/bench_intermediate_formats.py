@@ -0,0 +1,41 @@
+import sys
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+from etl.preprocess import etl_curtailment_data
+from etl.storage import read_partitioned, write_partitioned
+from fixture_server import synthetic_curtailment_export
+
+def dir_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+def timed(func, *args, **kwargs):
+    tic = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - tic
+
+if __name__ == '__main__':
+    # df_ready-like frame: preprocessed curtailment joined with a nominal power
+    df_ready = etl_curtailment_data(synthetic_curtailment_export(n_rows=1_000_000, n_plants=5000))
+    df_ready['nominal_power'] = np.random.default_rng(0).uniform(10, 5000, len(df_ready))
+    df_ready['curtailment_power'] = (100-df_ready['Stufe']) * df_ready['nominal_power']/100
+    tmp = tempfile.mkdtemp()
+    try:
+        csv_path, parquet_path = os.path.join(tmp, 'df_ready.csv'), os.path.join(tmp, 'df_ready')
+        _, t_csv_write = timed(df_ready.to_csv, csv_path, index=False)
+        df_csv, t_csv_read = timed(pd.read_csv, csv_path)
+        _, t_pq_write = timed(write_partitioned, df_ready, parquet_path)
+        df_pq, t_pq_read = timed(read_partitioned, parquet_path)
+        _, t_pq_month = timed(read_partitioned, parquet_path, months=['2022-06'])
+        print(f"rows: {len(df_ready)}")
+        print(f"csv:     write {t_csv_write:.2f}s, read {t_csv_read:.2f}s, {dir_size(csv_path) / 1e6:.1f} MB, Start dtype {df_csv['Start'].dtype}")
+        print(f"parquet: write {t_pq_write:.2f}s, read {t_pq_read:.2f}s, {dir_size(parquet_path) / 1e6:.1f} MB, Start dtype {df_pq['Start'].dtype}")
+        print(f"parquet: read one month {t_pq_month:.3f}s")
+    finally:
+        shutil.rmtree(tmp)
@@ -0,0 +1,47 @@
+import sys
+import os
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+import pandas as pd
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+from etl.load import database_setup, upsert_data
+from etl.preprocess import curtailment_modes, etl_curtailment_data, merge_and_calculate, merge_and_calculate_chunked
+from etl.storage import iter_partitioned, read_partitioned, write_partitioned
+from fixture_server import synthetic_curtailment_export
+
+N_PLANTS = 50_000
+
+def synthetic_eeg(seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'Anlagenschlüssel': np.char.add('E', np.arange(N_PLANTS).astype(str)), 'nominal_power': rng.uniform(10, 5000, N_PLANTS)})
+
+def in_memory(path, db_name):
+    df_ready = merge_and_calculate(etl_curtailment_data(read_partitioned(path)), synthetic_eeg(), output_path=None)
+    upsert_data(df_ready, db_name=db_name)
+    return len(df_ready)
+
+def chunked(path, db_name):
+    modes = curtailment_modes(iter_partitioned(path, columns=['Anlagenschlüssel', 'Start', 'Ende', 'Stufe (%)', 'Dauer (Min)']))
+    chunks = (etl_curtailment_data(chunk, modes) for chunk in iter_partitioned(path))
+    # Same loader as the bulk DAG, rollup included
+    return merge_and_calculate_chunked(chunks, synthetic_eeg(), load=partial(upsert_data, db_name=db_name))
+
+def measure(function, path, db_name):
+    database_setup(db_name)
+    tic = time.perf_counter()
+    rows = function(path, db_name)
+    return rows, time.perf_counter() - tic, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'curtailment_historical')
+        write_partitioned(synthetic_curtailment_export(n_rows=3_000_000, n_plants=N_PLANTS), path)
+        for function in [in_memory, chunked]:
+            # A fresh process and database per mode so that the peak RSS belongs to that mode alone
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                rows, seconds, peak_mb = executor.submit(measure, function, path, os.path.join(tmp, f'{function.__name__}.db')).result()
+            print(f"{function.__name__}: {rows:,} rows, {seconds:.1f}s, peak RSS {peak_mb:.0f} MB")
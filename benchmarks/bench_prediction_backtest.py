@@ -0,0 +1,76 @@
+import sys
+import os
+import time
+import numpy as np
+import pandas as pd
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+from prediction.prediction import Croston, curtailment_power_prediction
+from utils import CompactTimeline, recalculate_curtailment_power
+from bench_recalculate_curtailment_power import synthetic_events
+
+def curtailment_power_prediction_refit(df_in, start_date, method):
+    # Reference copy of the former refit-per-slot loop
+    df = df_in.copy()
+    df['curtailment_power_pred'] = None
+    for target_time in df.loc[df.TimeSlot >= start_date, 'TimeSlot']:
+        training_data = df[df.TimeSlot < target_time]['curtailment_power']
+        if method =='Naive':
+            prediction = training_data.iloc[-1]
+        elif method =='Croston':
+            croston = Croston(alpha=0.3,beta=0.2)
+            croston.fit(training_data.values, method='tsb')
+            prediction = croston.forecast(steps=1)
+        df.loc[df.TimeSlot==target_time, 'curtailment_power_pred'] = prediction
+    return df
+
+def wss_forecast_crosstab(df, lead_time=1, quantile=0.75, n_samples=1000):
+    # Reference copy of the former bootstrap with per-step np.random.choice
+    demand_binary = (df > 0).astype(int)
+    transition_matrix = pd.crosstab(demand_binary.shift(), demand_binary, normalize='index')
+    forecasts = []
+    for _ in range(n_samples):
+        forecast = []
+        current_state = demand_binary.iloc[-1]
+        for _ in range(lead_time):
+            current_state = np.random.choice([0, 1], p=transition_matrix.loc[current_state])
+            forecast.append(np.random.choice(df[df > 0], 1)[0] if current_state == 1 else 0)
+        forecasts.append(forecast)
+    return np.quantile(forecasts, quantile, axis=0)
+
+if __name__ == '__main__':
+    df_timeline = recalculate_curtailment_power(synthetic_events(300), 'H').reset_index(drop=True)
+    # The refit loop is quadratic, so it only backtests the last 500 hours
+    start_date = df_timeline['TimeSlot'].iloc[-500]
+    for method in ['Naive', 'Croston']:
+        tic = time.perf_counter()
+        df_old = curtailment_power_prediction_refit(df_timeline, start_date, method)
+        t_old = time.perf_counter() - tic
+        tic = time.perf_counter()
+        df_new = curtailment_power_prediction(df_timeline, start_date, method, plot=False)
+        t_new = time.perf_counter() - tic
+        assert df_old['curtailment_power_pred'].astype(float).equals(df_new['curtailment_power_pred'].astype(float)), method
+        print(f"{method}: 500 targets, refit {t_old:.2f}s, incremental {t_new:.4f}s")
+        tic = time.perf_counter()
+        curtailment_power_prediction(df_timeline, df_timeline['TimeSlot'].iloc[1], method, plot=False)
+        print(f"{method}: full-year backtest ({len(df_timeline) - 1} targets), incremental {time.perf_counter() - tic:.3f}s")
+    # WSS draws random paths, so the former per-slot bootstrap is only timed on 50 targets
+    tic = time.perf_counter()
+    for target in range(len(df_timeline) - 50, len(df_timeline)):
+        wss_forecast_crosstab(df_timeline['curtailment_power'].iloc[:target])
+    t_old = (time.perf_counter() - tic) / 50
+    tic = time.perf_counter()
+    df_new = curtailment_power_prediction(df_timeline, df_timeline['TimeSlot'].iloc[1], 'WSS', plot=False, seed=0)
+    t_new = (time.perf_counter() - tic) / (len(df_timeline) - 1)
+    print(f"WSS: crosstab and loops {t_old * 1000:.1f} ms/target, vectorized incremental {t_new * 1000:.3f} ms/target")
+    # The same backtest from a CompactTimeline, fitted from the curtailed slots of the history
+    events = synthetic_events(300)
+    timeline = CompactTimeline.from_curtailment(events, 'H')
+    start_date = timeline.slot_times([timeline.n_slots - 500])[0]
+    for method in ['Naive', 'Croston', 'WSS']:
+        df_dense = curtailment_power_prediction(timeline.to_frame().reset_index(drop=True), start_date, method, plot=False, seed=0)
+        tic = time.perf_counter()
+        df_compact = curtailment_power_prediction(timeline, start_date, method, plot=False, seed=0)
+        t_compact = time.perf_counter() - tic
+        expected = df_dense.loc[df_dense.TimeSlot >= start_date, 'curtailment_power_pred'].astype(float).to_numpy()
+        assert np.allclose(df_compact['curtailment_power_pred'].astype(float).to_numpy(), expected, rtol=1e-12, atol=1e-12), method
+        print(f"{method}: CompactTimeline input ({len(timeline.slot_index)} curtailed slots), 500 targets {t_compact:.4f}s")
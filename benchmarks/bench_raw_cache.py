@@ -0,0 +1,55 @@
+import sys
+import os
+import json
+import tempfile
+import time
+from datetime import datetime, timedelta
+import pandas as pd
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+from etl.cache import RawDataCache
+from etl.extract import curtailment_windows, download_curtailment_windows
+from fixture_server import FixtureServer, synthetic_curtailment_export
+
+def run(label, cache_dir, windows, server):
+    # A fresh cache object per run so that its stats count this run only
+    cache = RawDataCache(cache_dir)
+    tic = time.perf_counter()
+    df = download_curtailment_windows(windows, max_workers=8, base_url=server.url, cache=cache)
+    print(f"{label}: {len(df)} rows, {time.perf_counter() - tic:.2f}s, {cache.stats}")
+    return df, cache.stats
+
+def stats(hits=0, misses=0, refreshed=0, revalidated=0):
+    return {'hits': hits, 'misses': misses, 'refreshed': refreshed, 'revalidated': revalidated}
+
+if __name__ == '__main__':
+    # Finished windows up to 2022 plus one window reaching past today, which is still open
+    today = datetime.now()
+    windows = curtailment_windows(datetime(2022, 12, 31))
+    windows.append(((today - timedelta(days=10)).strftime('%Y-%m-%d'), (today + timedelta(days=1)).strftime('%Y-%m-%d')))
+    recent = synthetic_curtailment_export(n_rows=50, start=(today - timedelta(days=9)).strftime('%Y-%m-%d'), end=(today - timedelta(days=2)).strftime('%Y-%m-%d'), seed=1)
+    recent['ID'] = 'recent' + recent['ID']
+    export = pd.concat([synthetic_curtailment_export(), recent], ignore_index=True)
+    # Every request to the stand-in API takes 0.2s, like a slow remote export
+    with FixtureServer(export, latency=0.2) as server, tempfile.TemporaryDirectory() as cache_dir:
+        df_first, first = run('empty cache', cache_dir, windows, server)
+        assert first == stats(misses=len(windows))
+
+        # Closed windows come from disk, the open one is revalidated with its ETag (304)
+        df_second, second = run('warm cache', cache_dir, windows, server)
+        assert second == stats(hits=len(windows) - 1, revalidated=1)
+        assert df_second.equals(df_first)
+
+        # New events in the open window change its ETag, so it is downloaded again
+        server.df = pd.concat([export, recent.assign(ID='late' + recent['ID'])], ignore_index=True)
+        df_third, third = run('open window changed', cache_dir, windows, server)
+        assert third == stats(hits=len(windows) - 1, refreshed=1)
+        assert len(df_third) == len(df_first) + len(recent)
+
+        # A cached file that no longer matches its sha256 is fetched again
+        meta = [json.load(open(os.path.join(cache_dir, name))) for name in os.listdir(cache_dir) if name.endswith('.json')]
+        url = next(entry['url'] for entry in meta if f'val1={windows[0][0]}&' in entry['url'])
+        with open(RawDataCache(cache_dir)._paths(url)[0], 'ab') as f:
+            f.write(b'corrupted')
+        df_fourth, fourth = run('corrupted closed window', cache_dir, windows, server)
+        assert fourth == stats(hits=len(windows) - 2, misses=1, revalidated=1)
+        assert df_fourth.equals(df_third)
@@ -0,0 +1,64 @@
+import sys
+import os
+import time
+import numpy as np
+import pandas as pd
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+from utils import generate_complete_timeline, recalculate_curtailment_power
+
+def recalculate_curtailment_power_iterrows(df, freq="H"):
+    # Reference copy of the former row-by-row implementation
+    df_timeline = generate_complete_timeline(freq)
+    df_timeline['curtailment_power'] = 0.0
+    df_timeline['curtailment_energy'] = 0.0
+    df['Start'] = pd.to_datetime(df['Start'])
+    df['Ende'] = pd.to_datetime(df['Ende'])
+    if freq == "H":
+        delta = pd.Timedelta(hours=1)
+        unit_factor = 1
+    elif freq == "T":
+        delta = pd.Timedelta(minutes=1)
+        unit_factor = 60
+    elif freq == "D":
+        delta = pd.Timedelta(days=1)
+        unit_factor = 1/24
+    for _, row in df.iterrows():
+        overlapping_times = df_timeline[(df_timeline['TimeSlot'] >= row['Start']) & (df_timeline['TimeSlot'] <= row['Ende'])]
+        for time_slot in overlapping_times['TimeSlot']:
+            duration = min(time_slot + delta, row['Ende']) - max(time_slot, row['Start'])
+            duration_hours = duration.total_seconds() / 3600
+            curtailment_energy = row['curtailment_power'] * duration_hours
+            df_timeline.loc[df_timeline['TimeSlot'] == time_slot, 'curtailment_energy'] += curtailment_energy
+    df_timeline['curtailment_power'] = df_timeline['curtailment_energy']*unit_factor
+    df_timeline['cumulative_energy'] = df_timeline['curtailment_energy'].cumsum()
+    return df_timeline
+
+def synthetic_events(n_events, seed=0):
+    # Curtailment events of a single busy plant, 8 minutes to 6 hours long
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp('2021-01-01') + pd.to_timedelta(rng.integers(0, 365 * 24 * 60, n_events), unit='min')
+    dauer = pd.to_timedelta(rng.integers(8, 6 * 60, n_events), unit='min')
+    return pd.DataFrame({
+        'Start': start,
+        'Ende': start + dauer,
+        'nominal_power': 500.0,
+        'curtailment_power': rng.choice([100.0, 200.0, 350.0, 500.0], n_events),
+    })
+
+def timed(func, *args):
+    tic = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - tic
+
+if __name__ == '__main__':
+    # The reference loop is slow at minute resolution, so it gets fewer events there
+    for freq, n_events in [('D', 200), ('H', 200), ('T', 10)]:
+        df = synthetic_events(n_events)
+        df_new, t_new = timed(recalculate_curtailment_power, df.copy(), freq)
+        df_old, t_old = timed(recalculate_curtailment_power_iterrows, df.copy(), freq)
+        for col in ['curtailment_power', 'curtailment_energy', 'cumulative_energy']:
+            assert np.allclose(df_new[col].values, df_old[col].values.astype(float)), col
+        print(f"freq={freq} events={n_events}: iterrows {t_old:.3f}s, sweep {t_new:.4f}s, speedup x{t_old / t_new:.0f}")
+    df = synthetic_events(100000)
+    _, t_new = timed(recalculate_curtailment_power, df, 'T')
+    print(f"freq=T events=100000: sweep {t_new:.3f}s")
@@ -0,0 +1,80 @@
+import sys
+import os
+import time
+import logging
+import numpy as np
+import pandas as pd
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+from statsmodels.tsa.arima.model import ARIMA
+from prophet import Prophet
+from prediction.prediction import arima_predict, algo_prophet
+
+PRICE = 'Day-ahead Price [EUR/MWh]'
+
+def arima_predict_refit(df_in, start_date):
+    # Reference copy of the former full refit per target day
+    df = df_in.copy()
+    df['ARIMA_Prediction'] = None
+    df['day'] = df['timestamp'].dt.date
+    for target_date in df.loc[df.timestamp >= start_date, 'day'].unique():
+        training_data = df[df.day < target_date][PRICE]
+        model_fit = ARIMA(training_data, order=(7, 0, 1)).fit()
+        df.loc[df.day == target_date, 'ARIMA_Prediction'] = model_fit.forecast(steps=24).values
+    return df
+
+def algo_prophet_refit(price, start_date):
+    # Reference copy of the former full refit per target day
+    df = price[['timestamp', PRICE]].copy()
+    df.columns = ['ds', 'y']
+    df['day'] = df['ds'].dt.date
+    df['Prophet_Prediction'] = None
+    for target_date in df.loc[df.ds >= start_date, 'day'].unique():
+        model = Prophet(daily_seasonality=True)
+        model.fit(df[df['day'] < target_date])
+        future = model.make_future_dataframe(periods=24, freq='H', include_history=False)
+        df.loc[df.day == target_date, 'Prophet_Prediction'] = model.predict(future).set_index('ds')['yhat'].values
+    df.columns = ['timestamp', PRICE, 'day', 'Prophet_Prediction']
+    return df
+
+def synthetic_prices(n_days=120, seed=0):
+    rng = np.random.default_rng(seed)
+    timestamp = pd.date_range('2023-01-01', periods=24 * n_days, freq='H')
+    noise = np.zeros(len(timestamp))
+    for t in range(1, len(noise)):
+        noise[t] = 0.8 * noise[t - 1] + rng.normal(0, 5)
+    daily = 20 * np.sin(2 * np.pi * timestamp.hour / 24)
+    weekly = 10 * (timestamp.dayofweek >= 5)
+    return pd.DataFrame({'timestamp': timestamp, PRICE: 80 + daily - weekly + noise})
+
+def mae(df, column, start_date):
+    rows = df.timestamp >= start_date
+    return np.mean(np.abs(df.loc[rows, PRICE] - df.loc[rows, column].astype(float)))
+
+def compare(name, column, reference, runs, start_date):
+    tic = time.perf_counter()
+    df_ref = reference()
+    print(f"{name} full refit per day (reference): {time.perf_counter() - tic:.1f}s, MAE {mae(df_ref, column, start_date):.2f}")
+    for label, run in runs.items():
+        tic = time.perf_counter()
+        df = run()
+        deviation = np.max(np.abs(df.loc[df.timestamp >= start_date, column].astype(float) - df_ref.loc[df_ref.timestamp >= start_date, column].astype(float)))
+        print(f"{name} {label}: {time.perf_counter() - tic:.1f}s, MAE {mae(df, column, start_date):.2f}, max deviation from reference {deviation:.3g}")
+
+if __name__ == '__main__':
+    logging.getLogger('cmdstanpy').setLevel(logging.WARNING)
+    prices = synthetic_prices()
+    start_date = prices['timestamp'].iloc[-24 * 14]
+    n_jobs = max(2, os.cpu_count() or 1)
+    compare('ARIMA', 'ARIMA_Prediction', lambda: arima_predict_refit(prices, start_date), {
+        'refit per day': lambda: arima_predict(prices, start_date, plot=False),
+        'warm start per day': lambda: arima_predict(prices, start_date, plot=False, warm_start=True),
+        'warm start, refit every 7 days': lambda: arima_predict(prices, start_date, plot=False, refit_every=7, warm_start=True),
+        f'refit per day, n_jobs={n_jobs}': lambda: arima_predict(prices, start_date, plot=False, n_jobs=n_jobs),
+    }, start_date)
+    compare('Prophet', 'Prophet_Prediction', lambda: algo_prophet_refit(prices, start_date), {
+        'refit per day': lambda: algo_prophet(prices, start_date, plot=False),
+        'warm start per day': lambda: algo_prophet(prices, start_date, plot=False, warm_start=True),
+        'warm start, refit every 7 days': lambda: algo_prophet(prices, start_date, plot=False, refit_every=7, warm_start=True),
+        f'refit per day, n_jobs={n_jobs}': lambda: algo_prophet(prices, start_date, plot=False, n_jobs=n_jobs),
+    }, start_date)
+    print(f"cpu_count={os.cpu_count()}")
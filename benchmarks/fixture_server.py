@@ -0,0 +1,88 @@
+import hashlib
+import threading
+import time
+import numpy as np
+import pandas as pd
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+def synthetic_curtailment_export(n_rows=20000, n_plants=200, start='2021-01-01', end='2022-12-31', seed=0):
+    # Rows shaped like the redispatch CSV export
+    rng = np.random.default_rng(seed)
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    minutes = int((end - start).total_seconds() // 60)
+    begin = start + pd.to_timedelta(np.sort(rng.integers(0, minutes, n_rows)), unit='min')
+    dauer = rng.integers(8, 6 * 60, n_rows)
+    stufe = rng.choice([0.0, 30.0, 60.0, np.nan], n_rows)
+    return pd.DataFrame({
+        'ID': np.arange(n_rows).astype(str),
+        'Einsatz-ID': rng.integers(0, 10**6, n_rows),
+        'Start': begin.strftime('%Y-%m-%d %H:%M:%S'),
+        'Ende': (begin + pd.to_timedelta(dauer, unit='min')).strftime('%Y-%m-%d %H:%M:%S'),
+        'Dauer (Min)': dauer.astype(float),
+        'Gebiet': rng.choice(['Nord', 'Mitte', 'Süd'], n_rows),
+        'Ort Engpass': rng.choice(['UW A', 'UW B', 'UW C'], n_rows),
+        'Stufe (%)': stufe,
+        'Ursache': 'Netzengpass',
+        'Anlagenschlüssel': np.char.add('E', rng.integers(0, n_plants, n_rows).astype(str)),
+        'Anforderer': 'AVA',
+        'Netzbetreiber': 'AVA',
+        'Anlagen-ID': rng.integers(0, n_plants, n_rows).astype(str),
+        'Abrechnungs-ID': rng.integers(0, 10**6, n_rows).astype(str),
+        'Entschädigungspflicht': 'ja',
+    })
+
+class FixtureServer:
+    """
+    Local stand-in for the redispatch export API serving CSV fixtures.
+
+    Requests to /api/export/csv return the fixture rows with val1 < Start and
+    Ende < val2, after `latency` seconds, with an ETag honouring If-None-Match.
+    Use as a context manager; `url` is the base_url.
+    """
+
+    def __init__(self, df, latency=0.0, fail_every=0):
+        self.df = df
+        self.latency = latency
+        self.fail_every = fail_every
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests += 1
+                time.sleep(server.latency)
+                if server.fail_every and server.requests % server.fail_every == 0:
+                    self.send_error(503)
+                    return
+                params = parse_qs(urlparse(self.path).query)
+                body = server.export(params['val1'][0], params['val2'][0]).encode('utf-8')
+                etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Type', 'text/csv')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.httpd.server_address[1]}'
+
+    def export(self, start, end):
+        rows = self.df[(self.df['Start'] > start) & (self.df['Ende'] < end)]
+        return rows.to_csv(sep=';', index=False)
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
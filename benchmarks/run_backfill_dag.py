@@ -0,0 +1,42 @@
+import sys
+import os
+import sqlite3
+import tempfile
+import numpy as np
+import pandas as pd
+# The data directory has to be set before the etl modules are imported
+os.environ['CURTAILMENT_DATA_DIR'] = tempfile.mkdtemp()
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'dags'))
+from curtailment_backfill import curtailment_backfill_dag_instance
+from etl.preprocess import etl_curtailment_data
+from etl.storage import CURTAILMENT_ETL_PATH, CURTAILMENT_HISTORICAL_PATH, EEG_ETL_PATH, partition_months
+from fixture_server import FixtureServer, synthetic_curtailment_export
+
+N_PLANTS = 200
+
+if __name__ == '__main__':
+    # Runs the backfill DAG with dag.test() against the local stand-in API, twice to check idempotency
+    db_path = os.path.join(os.environ['CURTAILMENT_DATA_DIR'], 'power_data.db')
+    pd.DataFrame({'Anlagenschlüssel': [f'E{i}' for i in range(N_PLANTS)], 'nominal_power': np.linspace(10, 1000, N_PLANTS)}).to_parquet(EEG_ETL_PATH, index=False)
+    export = synthetic_curtailment_export(n_rows=5000, n_plants=N_PLANTS, start='2021-01-01', end='2021-06-30')
+    run_conf = {'start_month': '2021-01', 'end_month': '2021-06', 'db_path': db_path}
+    counts = []
+    with FixtureServer(export) as server:
+        for _ in range(2):
+            curtailment_backfill_dag_instance.test(run_conf={**run_conf, 'base_url': server.url})
+            with sqlite3.connect(db_path) as conn:
+                counts.append(conn.execute('SELECT COUNT(*), COUNT(DISTINCT ID) FROM Curtailment').fetchone())
+    print(f"export rows: {len(export)}, loaded (rows, IDs) per run: {counts}")
+    assert counts[0] == counts[1] == (len(export), len(export))
+    # Stufe/Dauer are filled with the modes of the whole history, as in a single etl of the export
+    with sqlite3.connect(db_path) as conn:
+        stored = pd.read_sql_query('SELECT ID, Stufe, Dauer FROM Curtailment ORDER BY ID', conn).set_index('ID')
+    expected = etl_curtailment_data(export).set_index('ID').loc[stored.index, ['Stufe', 'Dauer']]
+    assert (stored['Stufe'].to_numpy() == expected['Stufe'].to_numpy()).all()
+    assert (stored['Dauer'].to_numpy() == expected['Dauer'].to_numpy()).all()
+    # A month that no longer has events leaves no stale partitions behind for etl and load
+    with FixtureServer(export[export['Start'] < '2021-06-01']) as server:
+        curtailment_backfill_dag_instance.test(run_conf={**run_conf, 'base_url': server.url})
+    print(f"partitions after June emptied: raw {partition_months(CURTAILMENT_HISTORICAL_PATH)}, etl {partition_months(CURTAILMENT_ETL_PATH)}")
+    assert '2021-06' not in partition_months(CURTAILMENT_HISTORICAL_PATH)
+    assert '2021-06' not in partition_months(CURTAILMENT_ETL_PATH)
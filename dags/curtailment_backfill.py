@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+from functools import partial
+from airflow.decorators import dag, task
+from airflow.models.param import Param
+import sys
+import os
+import pandas as pd
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+from etl.extract import REDISPATCH_URL, download_curtailment_month, download_eeg_historical_data
+from etl.load import database_setup, upsert_data
+from etl.preprocess import etl_curtailment_partitions, etl_EEG_data, merge_and_calculate_chunked
+from etl.storage import CURTAILMENT_ETL_PATH, CURTAILMENT_HISTORICAL_PATH, EEG_ETL_PATH, partition_months, read_partitioned
+
+DB_PATH = os.path.join(os.path.dirname(__file__), '..', 'database', 'power_data.db')
+
+default_args = {
+    'owner': 'airflow',
+    'depends_on_past': False,
+    'start_date': datetime(2021, 1, 1),
+    'email_on_failure': False,
+    'email_on_retry': False,
+    'retries': 2,
+    'retry_delay': timedelta(minutes=5),
+}
+
+def backfill_months(start_month:str, end_month:str)->list:
+    # 'YYYY-MM' labels from start_month to end_month, both included
+    return [month.strftime('%Y-%m') for month in pd.period_range(start_month, end_month, freq='M')]
+
+@dag(
+    dag_id = 'curtailment_backfill',
+    default_args=default_args,
+    schedule_interval=None,
+    catchup=False,
+    params={
+        'start_month': Param('2021-01', type='string'),
+        'end_month': Param('2022-12', type='string'),
+        'base_url': Param(REDISPATCH_URL, type='string'),
+        'db_path': Param(DB_PATH, type='string'),
+    },
+    tags=['bulk', 'backfill']
+)
+def curtailment_backfill_dag():
+    # Mapped extract and load tasks per month partition, with the etl of the months in between.
+    # Every step only replaces its own months (Parquet partitions, upsert by ID) and a month without
+    # rows removes its partitions, so a failed month retries alone and rerunning the DAG for a range
+    # is idempotent.
+    @task
+    def prepare(params=None)->list:
+        database_setup(params['db_path'])
+        # EEG master data is shared by all months and downloaded once
+        if not os.path.exists(EEG_ETL_PATH):
+            etl_EEG_data(download_eeg_historical_data()).to_parquet(EEG_ETL_PATH, index=False)
+        return backfill_months(params['start_month'], params['end_month'])
+
+    @task
+    def extract_month(month:str, params=None)->str:
+        df = download_curtailment_month(month, base_url=params['base_url'], output_path=CURTAILMENT_HISTORICAL_PATH)
+        print(f"{month}: {len(df)} rows")
+        return month
+
+    @task
+    def etl_months(months:list)->list:
+        # The Stufe/Dauer fill modes come from the whole raw history like in initial_bulk_data_download,
+        # so the stored values do not depend on which DAG loaded a month last
+        months = list(months)
+        etl_curtailment_partitions(CURTAILMENT_HISTORICAL_PATH, CURTAILMENT_ETL_PATH, months=months)
+        return months
+
+    # SQLite takes one writer at a time, the months queue for the load instead of waiting on locks
+    @task(max_active_tis_per_dag=1)
+    def load_month(month:str, params=None):
+        if month not in partition_months(CURTAILMENT_ETL_PATH):
+            print(f"{month}: no curtailment data")
+            return 0
+        rows = merge_and_calculate_chunked(
+            [read_partitioned(CURTAILMENT_ETL_PATH, months=[month])],
+            pd.read_parquet(EEG_ETL_PATH, columns=['Anlagenschlüssel', 'nominal_power']),
+            load=partial(upsert_data, db_name=params['db_path'], table_name="Curtailment", raise_errors=True),
+        )
+        print(f"{month}: loaded {rows} rows")
+        return rows
+
+    load_month.expand(month=etl_months(extract_month.expand(month=prepare())))
+
+# Instantiate the DAG
+curtailment_backfill_dag_instance = curtailment_backfill_dag()
+
+if __name__ == '__main__':
+    curtailment_backfill_dag_instance.test()
@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+from airflow.decorators import dag, task
+import sys
+import os
+from itertools import chain
+import pandas as pd
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+from etl.cache import RawDataCache
+from etl.extract import download_curtailment_incremental
+from etl.load import database_setup, get_curtailment_watermark, upsert_data
+from etl.preprocess import CURTAILMENT_MODE_COLUMNS, curtailment_modes, etl_curtailment_data, etl_EEG_data, merge_and_calculate
+from etl.storage import CURTAILMENT_DAILY_DIR, CURTAILMENT_HISTORICAL_PATH, EEG_ETL_PATH, EEG_HISTORICAL_PATH, iter_partitioned
+
+DB_PATH = os.path.join(os.path.dirname(__file__), '..', 'database', 'power_data.db')
+
+default_args = {
+    'owner': 'airflow',
+    'depends_on_past': False,
+    'start_date': datetime(2021, 1, 1),
+    'email_on_failure': False,
+    'email_on_retry': False,
+    'retries': 1,
+    'retry_delay': timedelta(minutes=5),
+}
+
+@dag(
+    dag_id = 'daily_data_download',
+    default_args=default_args,
+    schedule_interval='@daily',
+    catchup=False,
+    tags=['daily']
+)
+def daily_data_download_dag():
+    # Like initial_bulk_data_download, the tasks exchange the path of a Parquet file, not a DataFrame
+    @task
+    def download_and_process_new_curtailment_data(ds=None):
+        database_setup(DB_PATH)
+        # Only fetch what is newer than the data already in the database
+        watermark = get_curtailment_watermark(DB_PATH)
+        print(f"curtailment watermark: {watermark}")
+        cache = RawDataCache()
+        df_curtailment = download_curtailment_incremental(watermark, cache=cache)
+        print(f"raw data cache: {cache.stats}")
+        if df_curtailment.empty:
+            return None
+        # One file per run date, so a retried run overwrites its own file
+        os.makedirs(CURTAILMENT_DAILY_DIR, exist_ok=True)
+        curtailment_etl_path = os.path.join(CURTAILMENT_DAILY_DIR, f'{ds}.parquet')
+        # Fill missing Stufe/Dauer with the modes of the raw history plus the new rows, not of the new rows alone,
+        # so the daily rows get the same values as the bulk and backfill DAGs would store
+        history = iter_partitioned(CURTAILMENT_HISTORICAL_PATH, columns=CURTAILMENT_MODE_COLUMNS)
+        modes = curtailment_modes(chain(history, [df_curtailment]))
+        etl_curtailment_data(df_curtailment, modes).to_parquet(curtailment_etl_path, index=False)
+        return curtailment_etl_path
+
+    @task
+    def merge_and_load_data(curtailment_etl_path:str):
+        if curtailment_etl_path is None:
+            print("no new curtailment data")
+            return
+        # EEG master data is prepared by the initial bulk DAG, older setups only have the raw file
+        if not os.path.exists(EEG_ETL_PATH):
+            etl_EEG_data(pd.read_parquet(EEG_HISTORICAL_PATH)).to_parquet(EEG_ETL_PATH, index=False)
+        df_eeg_etl = pd.read_parquet(EEG_ETL_PATH, columns=['Anlagenschlüssel', 'nominal_power'])
+        df_ready = merge_and_calculate(pd.read_parquet(curtailment_etl_path), df_eeg_etl, output_path=None)
+        upsert_data(df_ready, db_name=DB_PATH, table_name="Curtailment")
+
+    curtailment_etl_path = download_and_process_new_curtailment_data()
+
+    merge_and_load_data(curtailment_etl_path)
+
+# Instantiate the DAG
+daily_data_download_dag_instance = daily_data_download_dag()
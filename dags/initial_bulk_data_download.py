@@ -1,11 +1,17 @@
 from datetime import datetime, timedelta
 from airflow.decorators import dag, task
+from functools import partial
 import sys
 import os
+import pandas as pd
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+from etl.cache import RawDataCache
 from etl.extract import download_curtailment_historical_data, download_eeg_historical_data
-from etl.load import database_setup, insert_with_temp_table
-from etl.preprocess import etl_curtailment_data, etl_EEG_data, merge_and_calculate
+from etl.load import database_setup, upsert_data
+from etl.preprocess import etl_curtailment_partitions, etl_EEG_data, merge_and_calculate_chunked
+from etl.storage import CURTAILMENT_ETL_PATH, CURTAILMENT_HISTORICAL_PATH, EEG_ETL_PATH, iter_partitioned
+
+DB_PATH = os.path.join(os.path.dirname(__file__), '..', 'database', 'power_data.db')
 
 default_args = {
     'owner': 'airflow',
@@ -25,28 +31,38 @@ default_args = {
     tags=['bulk']
 )
 def bulk_data_download_dag():
+    # The tasks exchange paths of Parquet datasets below DATA_DIR, never DataFrames,
+    # so XCom only holds short strings and the tasks can run on different workers
     @task
-    def download_and_process_curtailment_data():
-        df_curtailment = download_curtailment_historical_data('2022-12-31')
-        df_curtailment_etl = etl_curtailment_data(df_curtailment)
-        return df_curtailment_etl
+    def download_and_process_curtailment_data()->str:
+        cache = RawDataCache()
+        download_curtailment_historical_data('2022-12-31', cache=cache, output_path=CURTAILMENT_HISTORICAL_PATH)
+        print(f"raw data cache: {cache.stats}")
+        return etl_curtailment_partitions(CURTAILMENT_HISTORICAL_PATH, CURTAILMENT_ETL_PATH)
 
     @task
-    def download_and_process_eeg_data():
-        df_eeg = download_eeg_historical_data()
-        df_eeg_etl = etl_EEG_data(df_eeg)
-        return df_eeg_etl
+    def download_and_process_eeg_data()->str:
+        cache = RawDataCache()
+        df_eeg = download_eeg_historical_data(cache=cache)
+        print(f"raw data cache: {cache.stats}")
+        etl_EEG_data(df_eeg).to_parquet(EEG_ETL_PATH, index=False)
+        return EEG_ETL_PATH
 
     @task
-    def merge_and_load_data(df_curtailment_etl, df_eeg_etl):
-        df_ready = merge_and_calculate(df_curtailment_etl, df_eeg_etl)
-        database_setup()  # Setup database
-        insert_with_temp_table(df_ready, db_name="power_data.db", table_name="Curtailment")
+    def merge_and_load_data(curtailment_etl_path:str, eeg_etl_path:str):
+        database_setup(DB_PATH)  # Setup database
+        # One month of curtailment data in memory at a time
+        rows = merge_and_calculate_chunked(
+            iter_partitioned(curtailment_etl_path),
+            pd.read_parquet(eeg_etl_path, columns=['Anlagenschlüssel', 'nominal_power']),
+            load=partial(upsert_data, db_name=DB_PATH, table_name="Curtailment"),
+        )
+        print(f"loaded {rows} rows")
 
-    df_curtailment_etl = download_and_process_curtailment_data()
-    df_eeg_etl = download_and_process_eeg_data()
+    curtailment_etl_path = download_and_process_curtailment_data()
+    eeg_etl_path = download_and_process_eeg_data()
 
-    merge_and_load_data(df_curtailment_etl, df_eeg_etl)
+    merge_and_load_data(curtailment_etl_path, eeg_etl_path)
 
 # Instantiate the DAG
 bulk_data_download_dag_instance = bulk_data_download_dag()
@@ -0,0 +1,135 @@
+"""
+float64 kernels for the Croston recursions
+
+The loops are compiled with Numba when it is installed. Without Numba the same
+recursions are evaluated as linear filters with NumPy/SciPy.
+"""
+
+import numpy as np
+from scipy.signal import lfilter
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+NUMBA_AVAILABLE = njit is not None
+
+
+def _exponential_smoothing_loop(values, alpha, init):
+    # y[0] = init, y[i] = y[i-1] + alpha * (values[i] - y[i-1])
+    out = np.empty(len(values))
+    if len(values) == 0:
+        return out
+    out[0] = init
+    for i in range(1, len(values)):
+        out[i] = out[i - 1] + alpha * (values[i] - out[i - 1])
+    return out
+
+
+def _exponential_smoothing_vectorized(values, alpha, init):
+    out = np.empty(len(values))
+    if len(values) == 0:
+        return out
+    out[0] = init
+    if len(values) > 1:
+        out[1:] = lfilter([alpha], [1.0, alpha - 1.0], values[1:], zi=[(1.0 - alpha) * init])[0]
+    return out
+
+
+def _exponential_smoothing_batch_loop(values, alphas, inits):
+    # values (series, n), alphas (series, candidates), inits (series,) -> (series, candidates, n)
+    n_series, n_values = values.shape
+    out = np.empty((n_series, alphas.shape[1], n_values))
+    for s in range(n_series):
+        for g in range(alphas.shape[1]):
+            out[s, g, 0] = inits[s]
+            for i in range(1, n_values):
+                out[s, g, i] = out[s, g, i - 1] + alphas[s, g] * (values[s, i] - out[s, g, i - 1])
+    return out
+
+
+def _exponential_smoothing_batch_vectorized(values, alphas, inits):
+    out = np.empty((values.shape[0], alphas.shape[1], values.shape[1]))
+    out[:, :, 0] = inits[:, None]
+    for i in range(1, values.shape[1]):
+        out[:, :, i] = out[:, :, i - 1] + alphas * (values[:, i, None] - out[:, :, i - 1])
+    return out
+
+
+def _croston_standard_loop(d, alpha, a0, p0, q0):
+    # level (a) and periodicity (p) move on demand only, q counts the periods since the last demand
+    n = len(d)
+    a = np.empty(n + 1)
+    p = np.empty(n + 1)
+    f = np.empty(n + 1)
+    a[0], p[0], f[0] = a0, p0, a0 / p0
+    q = q0
+    for t in range(n):
+        if d[t] > 0:
+            a[t + 1] = alpha * d[t] + (1 - alpha) * a[t]
+            p[t + 1] = alpha * q + (1 - alpha) * p[t]
+            f[t + 1] = a[t + 1] / p[t + 1]
+            q = 1
+        else:
+            a[t + 1], p[t + 1], f[t + 1] = a[t], p[t], f[t]
+            q += 1
+    return a, p, f, q
+
+
+def _croston_standard_vectorized(d, alpha, a0, p0, q0):
+    n = len(d)
+    demand = np.flatnonzero(d > 0)
+    # periods since the previous demand, seen at each demand
+    q = np.diff(demand, prepend=-q0)
+    final_q = q0 + n if len(demand) == 0 else n - demand[-1]
+    a_demand = lfilter([alpha], [1.0, alpha - 1.0], d[demand].astype(float), zi=[(1.0 - alpha) * a0])[0]
+    p_demand = lfilter([alpha], [1.0, alpha - 1.0], q.astype(float), zi=[(1.0 - alpha) * p0])[0]
+    # forward fill the demand updates, position 0 holds the initial state
+    seen = np.concatenate([[0], np.cumsum(d > 0)])
+    a = np.concatenate([[a0], a_demand])[seen]
+    p = np.concatenate([[p0], p_demand])[seen]
+    f = np.concatenate([[a0 / p0], a_demand / p_demand])[seen]
+    return a, p, f, final_q
+
+
+def _croston_tsb_loop(d, alpha, beta, a0, p0):
+    # level (a) moves on demand only, the demand probability (p) moves every period
+    n = len(d)
+    a = np.empty(n + 1)
+    p = np.empty(n + 1)
+    f = np.empty(n + 1)
+    a[0], p[0], f[0] = a0, p0, p0 * a0
+    for t in range(n):
+        if d[t] > 0:
+            a[t + 1] = alpha * d[t] + (1 - alpha) * a[t]
+            p[t + 1] = beta * 1 + (1 - beta) * p[t]
+        else:
+            a[t + 1] = a[t]
+            p[t + 1] = (1 - beta) * p[t]
+        f[t + 1] = p[t + 1] * a[t + 1]
+    return a, p, f
+
+
+def _croston_tsb_vectorized(d, alpha, beta, a0, p0):
+    occurrence = d > 0
+    a_demand = lfilter([alpha], [1.0, alpha - 1.0], d[occurrence].astype(float), zi=[(1.0 - alpha) * a0])[0]
+    seen = np.concatenate([[0], np.cumsum(occurrence)])
+    a = np.concatenate([[a0], a_demand])[seen]
+    p = np.empty(len(d) + 1)
+    p[0] = p0
+    if len(d):
+        p[1:] = lfilter([beta], [1.0, beta - 1.0], occurrence.astype(float), zi=[(1.0 - beta) * p0])[0]
+    return a, p, p * a
+
+
+if NUMBA_AVAILABLE:
+    exponential_smoothing = njit(cache=True)(_exponential_smoothing_loop)
+    exponential_smoothing_batch = njit(cache=True)(_exponential_smoothing_batch_loop)
+    croston_standard = njit(cache=True)(_croston_standard_loop)
+    croston_tsb = njit(cache=True)(_croston_tsb_loop)
+else:
+    exponential_smoothing = _exponential_smoothing_vectorized
+    exponential_smoothing_batch = _exponential_smoothing_batch_vectorized
+    croston_standard = _croston_standard_vectorized
+    croston_tsb = _croston_tsb_vectorized
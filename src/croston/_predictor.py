@@ -1,6 +1,8 @@
 # Standard library imports
 import logging
 import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, repeat
 from typing import Dict, Iterator, Optional
 
 # Third-party imports
@@ -19,6 +21,20 @@ from .croston import fit_croston
 logger = logging.getLogger("gluonts").getChild("croston")
 
 
+def _croston_samples(target, prediction_length, variant, no_of_params):
+    # Module level so that it can be sent to the worker processes.
+    # Returns None when there is no model for the series.
+    fit_pred = fit_croston(
+        target,
+        forecast_length=prediction_length,
+        croston_variant=variant,
+        number_parameters=no_of_params,
+    )
+    if fit_pred["croston_forecast"] is None:
+        return None
+    return fit_pred["croston_forecast"].reshape(1, -1)
+
+
 class CrostonForecastPredictor(RepresentablePredictor):
     """
     Wrapper for calling the `croston forecast
@@ -35,6 +51,11 @@ class CrostonForecastPredictor(RepresentablePredictor):
     trunc_length
         Maximum history length to feed to the model (some models become slow
         with very long series).
+    num_workers
+        Number of worker processes fitting the series in parallel, the
+        series are fitted in the calling process if None or 1.
+    chunk_size
+        Number of series sent to a worker process at once.
     """
 
     @validated()
@@ -45,6 +66,8 @@ class CrostonForecastPredictor(RepresentablePredictor):
         variant: str = "original",
         no_of_params: int = 2,
         trunc_length: Optional[int] = None,
+        num_workers: Optional[int] = None,
+        chunk_size: int = 32,
     ) -> None:
         super().__init__(prediction_length=prediction_length)
 
@@ -62,6 +85,8 @@ class CrostonForecastPredictor(RepresentablePredictor):
         self.prediction_length = prediction_length
         self.freq = freq
         self.trunc_length = trunc_length
+        self.num_workers = num_workers
+        self.chunk_size = chunk_size
         self.params = {
             "prediction_length": self.prediction_length,
             "output_types": ["samples"],
@@ -74,18 +99,43 @@ class CrostonForecastPredictor(RepresentablePredictor):
             return l
 
     def _run_croston_forecast(self, d, params):
-        fit_pred = fit_croston(
-            d["target"],
-            forecast_length=params["prediction_length"],
-            croston_variant=self.variant,
-            number_parameters=self.no_of_params,
+        out = _croston_samples(
+            d["target"], params["prediction_length"], self.variant, self.no_of_params
         )
-        try:
-            out = fit_pred["croston_forecast"].reshape(1, -1)
-        except:
-            out = None
         return {"samples": out}
 
+    def _entry_data(self, entry):
+        if isinstance(entry, dict):
+            return entry
+        data = entry.data
+        if self.trunc_length:
+            data = data[-self.trunc_length :]
+        return data
+
+    def _forecast_samples(self, entries, params):
+        # Yields (data, samples) in dataset order
+        if not self.num_workers or self.num_workers <= 1:
+            for data in entries:
+                yield data, self._run_croston_forecast(data, params)["samples"]
+            return
+
+        # Read the dataset one window at a time, each worker gets chunk_size series per task
+        window_size = self.num_workers * self.chunk_size
+        with ProcessPoolExecutor(max_workers=self.num_workers) as executor:
+            while True:
+                window = list(islice(entries, window_size))
+                if not window:
+                    break
+                samples = executor.map(
+                    _croston_samples,
+                    [data["target"] for data in window],
+                    repeat(params["prediction_length"]),
+                    repeat(self.variant),
+                    repeat(self.no_of_params),
+                    chunksize=self.chunk_size,
+                )
+                yield from zip(window, samples)
+
     def predict(
         self,
         dataset: Dataset,
@@ -101,23 +151,24 @@ class CrostonForecastPredictor(RepresentablePredictor):
 
         assert num_samples == 1, "Non Probabilistic Method only supports num_samples=1"
 
-        for entry in dataset:
-            if isinstance(entry, dict):
-                data = entry
-            else:
-                data = entry.data
-                if self.trunc_length:
-                    data = data[-self.trunc_length :]
-
-            params = self.params.copy()
-            params["num_samples"] = num_samples
-            forecast_dict = self._run_croston_forecast(data, params)
-            samples = np.array(forecast_dict["samples"])
-            expected_shape = (params["num_samples"], self.prediction_length)
+        params = self.params.copy()
+        params["num_samples"] = num_samples
+        expected_shape = (params["num_samples"], self.prediction_length)
+
+        entries = (self._entry_data(entry) for entry in dataset)
+        for data, samples in self._forecast_samples(entries, params):
+            if samples is None:
+                # No model for this series (e.g. no demand after the first period),
+                # keep the position in the output with a NaN forecast
+                logger.warning(
+                    f"Croston fit failed for item_id {data.get('item_id')}, forecasting NaN"
+                )
+                samples = np.full(expected_shape, np.nan)
+            samples = np.array(samples)
             assert (
                 samples.shape == expected_shape
             ), f"Expected shape {expected_shape} but found {samples.shape}"
 
             yield SampleForecast(
                 samples, forecast_start(data), self.freq, item_id=data["item_id"]
-            )
\ No newline at end of file
+            )
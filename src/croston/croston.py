@@ -7,6 +7,9 @@ croston model for intermittent time series
 import numpy as np
 import pandas as pd
 from scipy.optimize import minimize
+from scipy.sparse import issparse
+
+from ._kernels import exponential_smoothing, exponential_smoothing_batch
 
 
 def fit_croston(
@@ -19,7 +22,7 @@ def fit_croston(
     :return: dictionary of model parameters, in-sample forecast, and out-of-sample forecast
     """
 
-    input_series = np.asarray(input_endog)
+    input_series = np.asarray(input_endog, dtype=np.float64)
     epsilon = 1e-7
     input_length = len(input_series)
     non_zero_demand = np.where(input_series != 0)[0]
@@ -69,60 +72,167 @@ def fit_croston(
     }
 
 
-def _croston(
-    input_series, input_series_length, croston_variant, alpha, horizon, epsilon
+def fit_croston_batch(
+    input_endogs,
+    forecast_length,
+    croston_variant="original",
+    number_parameters=2,
+    grid_size=21,
+    refinement_rounds=6,
+    max_elements=2 ** 22,
 ):
+    """
+    Fit many series at once. The croston cost of all series is evaluated on a
+    grid of alpha candidates in a few vectorized passes, followed by rounds of
+    local grid refinement around the optimum of each series.
 
-    # Croston decomposition
-    non_zero_demand = np.where(input_series != 0)[0]  # find location of non-zero demand
+    :param input_endogs: 2D array with one series per row, list of 1D arrays, or scipy sparse matrix
+    :param forecast_length: forecast horizon
+    :param croston_variant: croston model type
+    :param number_parameters: 1 to share alpha between demand and interval, 2 otherwise
+    :param grid_size: number of alpha candidates on [0, 1] per parameter
+    :param refinement_rounds: number of local refinements, each halving the step
+    :param max_elements: bound on series x candidates x demands held in memory at once
+    :return: list of fit_croston dictionaries in input order
+    """
 
-    k = len(non_zero_demand)
-    z = input_series[non_zero_demand]  # demand
+    if issparse(input_endogs):
+        input_endogs = input_endogs.tocsr()
+        series = [input_endogs[i].toarray().ravel() for i in range(input_endogs.shape[0])]
+    else:
+        series = [np.asarray(s, dtype=np.float64) for s in input_endogs]
 
-    x = np.concatenate([[non_zero_demand[0]], np.diff(non_zero_demand)])  # intervals
+    epsilon = 1e-7
+    results = [
+        {"croston_model": None, "croston_fittedvalues": None, "croston_forecast": None}
+        for _ in series
+    ]
+
+    # series without demand after the first period have no model, like in fit_croston
+    decomposed = {}
+    for i, s in enumerate(series):
+        non_zero_demand = np.where(s != 0)[0]
+        if len(non_zero_demand) and list(non_zero_demand) != [0]:
+            decomposed[i] = _croston_decompose(s)
+
+    # batches of series with similar numbers of demands keep the padding small
+    order = sorted(decomposed, key=lambda i: len(decomposed[i][1]))
+    start = 0
+    while start < len(order):
+        stop = start + 1
+        while (
+            stop < len(order)
+            and (stop + 1 - start) * grid_size * len(decomposed[order[stop]][1]) <= max_elements
+        ):
+            stop += 1
+        batch = order[start:stop]
+        alphas = _croston_batch_opt(
+            [decomposed[i] for i in batch],
+            [len(series[i]) for i in batch],
+            croston_variant,
+            epsilon,
+            number_parameters,
+            grid_size,
+            refinement_rounds,
+        )
+        for i, alpha in zip(batch, alphas):
+            croston_training_result = _croston(
+                input_series=series[i],
+                input_series_length=len(series[i]),
+                croston_variant=croston_variant,
+                alpha=alpha,
+                horizon=forecast_length,
+                epsilon=epsilon,
+            )
+            results[i] = {
+                "croston_model": croston_training_result["model"],
+                "croston_fittedvalues": croston_training_result["in_sample_forecast"],
+                "croston_forecast": croston_training_result["out_of_sample_forecast"],
+            }
+        start = stop
 
-    # initialize
+    return results
 
-    init = [z[0], np.mean(x)]
 
-    zfit = np.array([None] * k)
-    xfit = np.array([None] * k)
+def _croston_decompose(input_series):
 
-    # assign initial values and prameters
+    # Croston decomposition
+    non_zero_demand = np.where(input_series != 0)[0]  # find location of non-zero demand
 
-    zfit[0] = init[0]
-    xfit[0] = init[1]
+    z = input_series[non_zero_demand].astype(np.float64)  # demand
 
-    if len(alpha) == 1:
-        a_demand = alpha[0]
-        a_interval = alpha[0]
+    x = np.concatenate([[non_zero_demand[0]], np.diff(non_zero_demand)]).astype(
+        np.float64
+    )  # intervals
 
-    else:
-        a_demand = alpha[0]
-        a_interval = alpha[1]
+    return non_zero_demand, z, x
+
+
+def _correction_factor(a_interval, croston_variant, epsilon):
 
-    # compute croston variant correction factors
+    # compute croston variant correction factors, a_interval may be an array
     #   sba: syntetos-boylan approximation
     #   sbj: shale-boylan-johnston
     #   tsb: teunter-syntetos-babai
 
     if croston_variant == "sba":
-        correction_factor = 1 - (a_interval / 2)
+        return 1 - (a_interval / 2)
 
     elif croston_variant == "sbj":
-        correction_factor = 1 - a_interval / (2 - a_interval + epsilon)
+        return 1 - a_interval / (2 - a_interval + epsilon)
 
     else:
-        correction_factor = 1
+        return 1
+
+
+def _croston_demand_rate(z, x, alpha, croston_variant, epsilon):
+
+    # initialize
+
+    init = [z[0], np.mean(x)]
+
+    if len(alpha) == 1:
+        a_demand = alpha[0]
+        a_interval = alpha[0]
+
+    else:
+        a_demand = alpha[0]
+        a_interval = alpha[1]
+
+    correction_factor = _correction_factor(a_interval, croston_variant, epsilon)
 
     # fit model
 
-    for i in range(1, k):
-        zfit[i] = zfit[i - 1] + a_demand * (z[i] - zfit[i - 1])  # demand
-        xfit[i] = xfit[i - 1] + a_interval * (x[i] - xfit[i - 1])  # interval
+    zfit = exponential_smoothing(z, float(a_demand), float(init[0]))  # demand
+    xfit = exponential_smoothing(x, float(a_interval), float(init[1]))  # interval
 
     cc = correction_factor * zfit / (xfit + epsilon)
 
+    return a_demand, a_interval, correction_factor, zfit, xfit, cc
+
+
+def _croston_in_sample(non_zero_demand, cc, input_series_length):
+
+    # demand rate of each non-zero demand holds until the next one
+
+    frc_in = np.zeros(input_series_length)
+    frc_in[non_zero_demand[0] :] = np.repeat(
+        cc, np.diff(non_zero_demand, append=input_series_length)
+    )
+
+    return frc_in
+
+
+def _croston(
+    input_series, input_series_length, croston_variant, alpha, horizon, epsilon
+):
+
+    non_zero_demand, z, x = _croston_decompose(input_series)
+
+    a_demand, a_interval, correction_factor, zfit, xfit, cc = _croston_demand_rate(
+        z, x, alpha, croston_variant, epsilon
+    )
+
     croston_model = {
         "a_demand": a_demand,
         "a_interval": a_interval,
@@ -134,18 +244,12 @@ def _croston(
 
     # calculate in-sample demand rate
 
-    frc_in = np.zeros(input_series_length)
-    tv = np.concatenate(
-        [non_zero_demand, [input_series_length]]
-    )  # Time vector used to create frc_in forecasts
-
-    for i in range(k):
-        frc_in[tv[i] : min(tv[i + 1], input_series_length)] = cc[i]
+    frc_in = _croston_in_sample(non_zero_demand, cc, input_series_length)
 
     # forecast out_of_sample demand rate
 
     if horizon > 0:
-        frc_out = np.array([cc[k - 1]] * horizon)
+        frc_out = np.full(horizon, cc[-1])
 
     else:
         frc_out = None
@@ -170,11 +274,15 @@ def _croston_opt(
 
     p0 = np.array([0.1] * number_parameters)
 
+    # the decomposition does not depend on the parameters, compute it once
+    non_zero_demand, z, x = _croston_decompose(input_series)
+    segment_length = np.diff(non_zero_demand, append=input_series_length)
+
     wopt = minimize(
         fun=_croston_cost,
         x0=p0,
         method="Nelder-Mead",
-        args=(input_series, input_series_length, croston_variant, epsilon),
+        args=(z, x, segment_length, input_series_length, croston_variant, epsilon),
     )
 
     constrained_wopt = np.minimum([1], np.maximum([0], wopt.x))
@@ -182,21 +290,119 @@ def _croston_opt(
     return constrained_wopt
 
 
-def _croston_cost(p0, input_series, input_series_length, croston_variant, epsilon):
+def _croston_cost(
+    p0, z, x, segment_length, input_series_length, croston_variant, epsilon
+):
 
     # cost function for croston and variants
+    #   the in-sample forecast is 0 before the first demand and cc[i] from demand i
+    #   until the next one, where the series is z[i] on the first period and 0 after,
+    #   so the squared errors can be summed per demand instead of per period
 
-    frc_in = _croston(
-        input_series=input_series,
-        input_series_length=input_series_length,
-        croston_variant=croston_variant,
-        alpha=p0,
-        horizon=0,
-        epsilon=epsilon,
-    )["in_sample_forecast"]
+    cc = _croston_demand_rate(z, x, p0, croston_variant, epsilon)[-1]
 
-    E = input_series - frc_in
-    E = E[E != np.array(None)]
-    E = np.mean(E ** 2)
+    E = np.sum((z - cc) ** 2 + (segment_length - 1) * cc ** 2)
+    E = E / input_series_length
 
-    return E
\ No newline at end of file
+    return E
+
+
+def _croston_batch_opt(
+    decomposed,
+    input_series_length,
+    croston_variant,
+    epsilon,
+    number_parameters,
+    grid_size,
+    refinement_rounds,
+):
+
+    # pad the decompositions to (series, demands), padded demands have no weight in the cost
+
+    n_series = len(decomposed)
+    k = max(len(z) for _, z, _ in decomposed)
+    z = np.zeros((n_series, k))
+    x = np.ones((n_series, k))
+    segment_length = np.zeros((n_series, k))
+    init = np.empty((2, n_series))
+    for row, ((non_zero_demand, z_row, x_row), length) in enumerate(
+        zip(decomposed, input_series_length)
+    ):
+        z[row, : len(z_row)] = z_row
+        x[row, : len(x_row)] = x_row
+        segment_length[row, : len(z_row)] = np.diff(non_zero_demand, append=length)
+        init[:, row] = z_row[0], np.mean(x_row)
+    batch = (z, x, segment_length, init)
+
+    # grid search
+
+    grid = np.tile(np.linspace(0, 1, grid_size), (n_series, 1))
+    a_demand, a_interval = _croston_batch_argmin(
+        batch, grid, grid, croston_variant, epsilon, number_parameters
+    )
+
+    # local refinement, the current optimum stays a candidate so the cost never increases
+
+    step = 1 / (grid_size - 1)
+    offsets = np.linspace(-1, 1, 5)
+    for _ in range(refinement_rounds):
+        candidates_demand = np.clip(a_demand[:, None] + step * offsets, 0, 1)
+        candidates_interval = np.clip(a_interval[:, None] + step * offsets, 0, 1)
+        a_demand, a_interval = _croston_batch_argmin(
+            batch,
+            candidates_demand,
+            candidates_interval,
+            croston_variant,
+            epsilon,
+            number_parameters,
+        )
+        step /= 2
+
+    if number_parameters == 1:
+        return [np.array([a]) for a in a_demand]
+    return [np.array([a_d, a_i]) for a_d, a_i in zip(a_demand, a_interval)]
+
+
+def _croston_batch_argmin(
+    batch, candidates_demand, candidates_interval, croston_variant, epsilon, number_parameters
+):
+
+    # cost of every candidate of every series
+    #   per series sum_j (z_j - c_j * w_j) ** 2 + (L_j - 1) * (c_j * w_j) ** 2
+    #   = sum_j z_j ** 2 - 2 * z_j * w_j * c_j + L_j * w_j ** 2 * c_j ** 2
+    #   with w = zfit and c = correction_factor / (xfit + epsilon), so all pairs of
+    #   demand and interval candidates follow from two batched matrix products
+
+    z, x, segment_length, init = batch
+    series = np.arange(len(z))
+
+    if number_parameters == 1:
+        candidates_interval = candidates_demand
+
+    zfit = exponential_smoothing_batch(z, candidates_demand, init[0])
+    xfit = exponential_smoothing_batch(x, candidates_interval, init[1])
+    c = (
+        np.broadcast_to(
+            _correction_factor(candidates_interval, croston_variant, epsilon),
+            candidates_interval.shape,
+        )[..., None]
+        / (xfit + epsilon)
+    )
+    zw = z[:, None, :] * zfit
+    lw2 = segment_length[:, None, :] * zfit ** 2
+    z2 = np.sum(z ** 2, axis=1)
+
+    if number_parameters == 1:
+        E = z2[:, None] - 2 * np.sum(zw * c, axis=2) + np.sum(lw2 * c ** 2, axis=2)
+        best = np.argmin(E, axis=1)
+        return candidates_demand[series, best], candidates_demand[series, best]
+
+    E = (
+        z2[:, None, None]
+        - 2 * np.matmul(zw, c.transpose(0, 2, 1))
+        + np.matmul(lw2, (c ** 2).transpose(0, 2, 1))
+    )
+    best_demand, best_interval = np.unravel_index(
+        np.argmin(E.reshape(len(z), -1), axis=1), E.shape[1:]
+    )
+    return candidates_demand[series, best_demand], candidates_interval[series, best_interval]
@@ -0,0 +1,110 @@
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+import pandas as pd
+from utils import CompactTimeline, timeline_bounds
+
+# Frequencies pre-aggregated by the loader into CurtailmentRollup
+ROLLUP_FREQS = ('H', 'D')
+
+def get_database_path(db_name="power_data.db"):
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    db_path = os.path.join(base_dir, "database", db_name)
+    return db_path
+
+class CurtailmentStore:
+    """
+    Read-only access to power_data.db for the Streamlit app.
+
+    One shared connection serves all parameterized queries. Computed timelines are
+    kept in an LRU cache keyed by (Anlagenschlüssel, freq, data version); SQLite's
+    data_version changes whenever the loader commits, which invalidates the cache.
+
+    Parameters
+    ----------
+    db_path
+        Path of the SQLite database.
+    cache_size
+        Number of timelines kept in memory.
+    """
+
+    def __init__(self, db_path, cache_size=32):
+        self.conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True, check_same_thread=False)
+        self.cache_size = cache_size
+        self._timelines = OrderedDict()
+        self._lock = threading.Lock()
+
+    def query(self, sql, params=()):
+        with self._lock:
+            return pd.read_sql_query(sql, self.conn, params=params)
+
+    def data_version(self):
+        with self._lock:
+            return self.conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def anlagenschlüssel(self):
+        return self.query('SELECT DISTINCT Anlagenschlüssel FROM Curtailment ORDER BY Anlagenschlüssel')['Anlagenschlüssel']
+
+    def events(self, anlagenschlüssel):
+        return self.query('''
+            SELECT Start, Ende, nominal_power, curtailment_power
+            FROM Curtailment
+            WHERE Anlagenschlüssel = ?
+        ''', (anlagenschlüssel,))
+
+    def _rollup_timeline(self, anlagenschlüssel, freq):
+        # Hourly and daily energy comes straight from the rollup table when it is filled
+        rollup = self.query('''
+            SELECT TimeSlot, curtailment_energy
+            FROM CurtailmentRollup
+            WHERE Anlagenschlüssel = ? AND freq = ?
+        ''', (anlagenschlüssel, freq))
+        if rollup.empty:
+            return None
+        events = self.query('''
+            SELECT Start, Ende, curtailment_power
+            FROM Curtailment
+            WHERE Anlagenschlüssel = ?
+        ''', (anlagenschlüssel,))
+        # Events loaded without updating the rollup (e.g. before it existed) leave the first or last
+        # curtailed slot of the plant uncovered; such a plant is recalculated from its events.
+        # An event fills the slots from ceil(Start) up to the one before ceil(Ende).
+        delta = pd.tseries.frequencies.to_offset(freq)
+        starts, endes = pd.to_datetime(events['Start']), pd.to_datetime(events['Ende'])
+        first_slot, last_slot = starts.dt.ceil(freq), endes.dt.ceil(freq) - delta
+        curtailed = (events['curtailment_power'].fillna(0) != 0) & (first_slot <= last_slot)
+        slots = pd.to_datetime(rollup['TimeSlot'])
+        if slots.min() != first_slot[curtailed].min() or slots.max() != last_slot[curtailed].max():
+            return None
+        start, end = timeline_bounds(starts, endes)
+        return CompactTimeline.from_slots(slots, rollup['curtailment_energy'], freq, start, end)
+
+    def timeline(self, anlagenschlüssel, freq="H"):
+        key = (anlagenschlüssel, freq, self.data_version())
+        with self._lock:
+            if key in self._timelines:
+                self._timelines.move_to_end(key)
+                return self._timelines[key]
+        timeline = None
+        if freq in ROLLUP_FREQS:
+            try:
+                timeline = self._rollup_timeline(anlagenschlüssel, freq)
+            except pd.errors.DatabaseError:
+                # Database created before the rollup table existed
+                timeline = None
+        if timeline is None:
+            # Curtailment is mostly zero, so keep only the curtailed slots
+            timeline = CompactTimeline.from_curtailment(self.events(anlagenschlüssel), freq)
+        with self._lock:
+            self._timelines[key] = timeline
+            while len(self._timelines) > self.cache_size:
+                self._timelines.popitem(last=False)
+        return timeline
+
+    def schema(self):
+        # (table, [(column, type, pk)]) for every table
+        with self._lock:
+            tables = [row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+            return [(table, [(row[1], row[2], row[5]) for row in self.conn.execute('SELECT * FROM pragma_table_info(?)', (table,))])
+                    for table in tables]
@@ -0,0 +1,98 @@
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from urllib.parse import urlparse
+from .storage import DATA_DIR
+
+# Below CURTAILMENT_DATA_DIR like the datasets, so workers sharing that volume share the cache
+DEFAULT_CACHE_DIR = os.path.join(DATA_DIR, 'raw_cache')
+
+def file_sha256(path:str)->str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class RawDataCache:
+    """
+    On-disk cache of raw downloads keyed by URL.
+
+    Closed entries (finished historical windows, yearly EEG files) are served from
+    disk while their content hash matches the stored one. Open entries are
+    downloaded again, or revalidated with their ETag when the server sends one.
+
+    Parameters
+    ----------
+    cache_dir
+        Directory holding one data file and one JSON metadata file per URL.
+    """
+
+    def __init__(self, cache_dir:str=DEFAULT_CACHE_DIR) -> None:
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self._stats = {'hits': 0, 'misses': 0, 'refreshed': 0, 'revalidated': 0}
+        self._lock = threading.Lock()
+
+    @property
+    def stats(self)->dict:
+        with self._lock:
+            return dict(self._stats)
+
+    def _count(self, outcome:str):
+        with self._lock:
+            self._stats[outcome] += 1
+
+    def _paths(self, url:str):
+        # Keep the extension of the URL so that readers can infer the compression
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        extension = os.path.splitext(urlparse(url).path)[1] or '.data'
+        return os.path.join(self.cache_dir, key + extension), os.path.join(self.cache_dir, key + '.json')
+
+    def _read_meta(self, meta_path:str):
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def get(self, url:str, download, closed:bool=True)->str:
+        """
+        :param url: URL of the raw file, used as cache key
+        :param download: callable(url, fileobj, etag) writing the content to fileobj and
+            returning (modified, etag); modified is False when the server answered 304
+        :param closed: whether the content can no longer change
+        :return: path of the cached file
+        """
+        data_path, meta_path = self._paths(url)
+        meta = self._read_meta(meta_path)
+        cached = meta is not None and os.path.exists(data_path) and file_sha256(data_path) == meta['sha256']
+        if cached and closed:
+            self._count('hits')
+            return data_path
+
+        tmp_path = f'{data_path}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                modified, etag = download(url, f, meta['etag'] if cached else None)
+            if cached and not modified:
+                self._count('revalidated')
+                return data_path
+            os.replace(tmp_path, data_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        meta = {
+            'url': url,
+            'sha256': file_sha256(data_path),
+            'etag': etag,
+            'closed': closed,
+            'fetched_at': datetime.now().isoformat(timespec='seconds'),
+        }
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        self._count('refreshed' if cached else 'misses')
+        return data_path
@@ -1,35 +1,130 @@
+import io
+import os
+import shutil
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import pandas as pd
+from pandas.api.types import union_categoricals
 from datetime import datetime, timedelta
+from .storage import CURTAILMENT_HISTORICAL_PATH, EEG_HISTORICAL_PATH, delete_partitions, month_labels, write_partitioned
+from .instrumentation import instrument
 
-def download_curtailment_data(start:str, end:str)->pd.DataFrame:
-    url = f'https://redispatch-run.azurewebsites.net/api/export/csv?&networkoperator=ava&type=finished&orderDirection=desc&orderBy=start&chunkNr=1&param1=start&op1=gt&startOp=gt&val1={start}&param2=end&op2=lt&endOp=lt&val2={end}'
+REDISPATCH_URL = 'https://redispatch-run.azurewebsites.net'
+
+def download_to_file(url:str, fileobj, etag:str=None, retries:int=3, backoff:float=1.0, timeout:float=60):
+    # Stream url into fileobj and return (modified, etag). With an etag the request is
+    # conditional and a 304 Not Modified leaves fileobj empty. Transient errors are
+    # retried with exponential backoff, the last one is re-raised.
+    headers = {'If-None-Match': etag} if etag else {}
+    for attempt in range(retries + 1):
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=timeout) as response:
+                fileobj.seek(0)
+                fileobj.truncate()
+                shutil.copyfileobj(response, fileobj)
+                return True, response.headers.get('ETag')
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return False, etag
+            if attempt == retries:
+                raise
+        except Exception:
+            if attempt == retries:
+                raise
+        time.sleep(backoff * 2 ** attempt)
+
+def fetch_with_retry(url:str, retries:int=3, backoff:float=1.0, timeout:float=60)->bytes:
+    buffer = io.BytesIO()
+    download_to_file(url, buffer, retries=retries, backoff=backoff, timeout=timeout)
+    return buffer.getvalue()
+
+@instrument()
+def download_curtailment_data(start:str, end:str, base_url:str=REDISPATCH_URL, retries:int=3, cache=None, raise_errors:bool=False)->pd.DataFrame:
+    # cache: optional etl.cache.RawDataCache serving finished windows from disk
+    # raise_errors: re-raise instead of returning an empty frame, e.g. to let an Airflow task retry
+    url = f'{base_url}/api/export/csv?&networkoperator=ava&type=finished&orderDirection=desc&orderBy=start&chunkNr=1&param1=start&op1=gt&startOp=gt&val1={start}&param2=end&op2=lt&endOp=lt&val2={end}'
     try:
-        df = pd.read_csv(url, sep=';')
+        if cache is None:
+            source = io.BytesIO(fetch_with_retry(url, retries=retries))
+        else:
+            # Windows that ended before today only hold finished events and never change
+            closed = datetime.strptime(end, '%Y-%m-%d').date() < datetime.now().date()
+            source = cache.get(url, partial(download_to_file, retries=retries), closed=closed)
+        df = pd.read_csv(source, sep=';')
         print(f"downloaded {len(df)} rows")
         return df
     except Exception as e:
         print(f"An error occurred: {e}")
+        if raise_errors:
+            raise
         return pd.DataFrame()
 
-def download_curtailment_historical_data(end: str = 'now'):
-    final_end_date = datetime.now() if end == 'now' else datetime.strptime(end, '%Y-%m-%d')
-    start_date = datetime(2021,1,1)
-    end_date = datetime(2021,2,1)
-    all_data = pd.DataFrame()
+def curtailment_windows(final_end_date:datetime, start_date:datetime=datetime(2021,1,1))->list:
+    # (start, end) strings of the ~monthly windows requested from the redispatch API
+    end_date = start_date + timedelta(days=31)
+    windows = []
     while start_date < final_end_date:
-        str_start_date = start_date.strftime('%Y-%m-%d')
-        str_end_date = min(end_date,final_end_date).strftime('%Y-%m-%d')
-        chunk_data = download_curtailment_data(str_start_date, str_end_date)
-        all_data = pd.concat([all_data, chunk_data], ignore_index=True)
+        windows.append((start_date.strftime('%Y-%m-%d'), min(end_date,final_end_date).strftime('%Y-%m-%d')))
         start_date = end_date + timedelta(days=1)
         end_date += timedelta(days=30)
         if end_date > final_end_date:
             end_date = final_end_date
+    return windows
+
+def download_curtailment_windows(windows:list, max_workers:int=8, base_url:str=REDISPATCH_URL, cache=None, retries:int=3)->pd.DataFrame:
+    # Download the windows concurrently and concatenate the chunks once, in window order.
+    # A window that still fails after its retries raises, so that a history is never written
+    # with a month missing and the Airflow task fails and retries instead.
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        chunks = list(executor.map(lambda window: download_curtailment_data(*window, base_url=base_url, retries=retries, cache=cache, raise_errors=True), windows))
+    # Windows without events
+    chunks = [chunk for chunk in chunks if not chunk.empty]
+    if not chunks:
+        return pd.DataFrame()
+    all_data = pd.concat(chunks, ignore_index=True)
     all_data.drop_duplicates(subset=['ID'], keep='first', inplace=True)
-    all_data.to_csv("../../data/curtailment_historical.csv",index=False)
     return all_data
 
-def download_eeg_data(year:str)->pd.DataFrame:
+def download_curtailment_historical_data(end: str = 'now', max_workers:int=8, base_url:str=REDISPATCH_URL, cache=None, output_path:str=CURTAILMENT_HISTORICAL_PATH):
+    final_end_date = datetime.now() if end == 'now' else datetime.strptime(end, '%Y-%m-%d')
+    all_data = download_curtailment_windows(curtailment_windows(final_end_date), max_workers, base_url, cache)
+    if not all_data.empty:
+        write_partitioned(all_data, output_path)
+    return all_data
+
+def download_curtailment_month(month:str, base_url:str=REDISPATCH_URL, retries:int=3, cache=None, output_path:str=CURTAILMENT_HISTORICAL_PATH, overlap_days:int=7)->pd.DataFrame:
+    # Events starting in month 'YYYY-MM'. The window reaches overlap_days into the next month for
+    # events ending there; rows starting outside the month are dropped so that every event belongs
+    # to exactly one partition. Writing the partition replaces only this month, and a month without
+    # rows removes a partition left by an earlier run, so reruns are idempotent.
+    first_day = pd.Timestamp(f'{month}-01')
+    start = (first_day - timedelta(days=1)).strftime('%Y-%m-%d')
+    end = (first_day + pd.offsets.MonthBegin(1) + timedelta(days=overlap_days)).strftime('%Y-%m-%d')
+    df = download_curtailment_data(start, end, base_url, retries, cache, raise_errors=True)
+    if not df.empty:
+        df = df[month_labels(df['Start']) == month].reset_index(drop=True)
+    if df.empty:
+        delete_partitions(output_path, [month])
+    else:
+        write_partitioned(df, output_path)
+    return df
+
+def download_curtailment_incremental(watermark=None, end:str='now', lookback_days:int=2, max_workers:int=8, base_url:str=REDISPATCH_URL, cache=None)->pd.DataFrame:
+    # Fetch only the windows after the newest Start already loaded (see load.get_curtailment_watermark).
+    # The lookback re-reads events that were still running at the last run; upsert_data updates the
+    # overlapping IDs with their newer versions instead of inserting them twice.
+    final_end_date = datetime.now() if end == 'now' else datetime.strptime(end, '%Y-%m-%d')
+    if watermark is None:
+        start_date = datetime(2021,1,1)
+    else:
+        start_date = datetime.combine(pd.Timestamp(watermark).date(), datetime.min.time()) - timedelta(days=lookback_days)
+    return download_curtailment_windows(curtailment_windows(final_end_date, start_date), max_workers, base_url, cache)
+
+def download_eeg_data(year:str, chunksize:int=100_000, cache=None)->pd.DataFrame:
     if year =='2021':
         url = 'https://www.netztransparenz.de/xspproxy/api/staticfiles/ntp-relaunch/dokumente/erneuerbare%20energien%20und%20umlagen/eeg/eeg-abrechnungen/eeg-jahresabrechnungen/eeg-anlagenstammdaten/tennettsogmbheeg-zahlungenstammdaten2021.zip'
     elif year =='2022':
@@ -38,18 +133,65 @@ def download_eeg_data(year:str)->pd.DataFrame:
         print("Year not supported")
         return None
     try:
-        df = pd.read_csv(url, sep=';', encoding='ISO-8859-1')
+        if cache is not None:
+            # The yearly files are published once, so a cached copy is always valid
+            path = cache.get(url, partial(download_to_file, timeout=300), closed=True)
+            df = read_eeg_data(path, chunksize)
+        else:
+            # Spool the ZIP to disk so that only one chunk of rows is held in memory
+            with tempfile.NamedTemporaryFile(suffix='.zip') as tmp:
+                download_to_file(url, tmp, timeout=300)
+                tmp.flush()
+                df = read_eeg_data(tmp.name, chunksize)
         print(f"downloaded {len(df)} rows")
     except Exception as e:
         print(f"An error occurred: {e}")
+        df = pd.DataFrame()
     return df
 
-def download_eeg_historical_data()->pd.DataFrame:
-    df_2021 = download_eeg_data('2021')
-    df_2022 = download_eeg_data('2022')
-    all_data = pd.concat([df_2021, df_2022], ignore_index=True)
-    all_data.to_csv("../../data/eeg_historical.csv",index=False)
-    return 
+# Columns of the EEG Anlagenstammdaten used by etl_EEG_data and merge_and_calculate
+EEG_USECOLS = ['EEG_Anlagenschlüssel', 'Inbetriebnahme', 'Installierte_Leistung', 'NB_BNR', 'Gemeindeschlüssel']
+EEG_DTYPES = {
+    'EEG_Anlagenschlüssel': str,
+    'Inbetriebnahme': str,
+    'Installierte_Leistung': str,
+    'NB_BNR': 'category',
+    'Gemeindeschlüssel': 'category',
+}
+
+def read_eeg_data(path, chunksize:int=100_000)->pd.DataFrame:
+    # Read an EEG Anlagenstammdaten file in chunks, keeping only the first row with
+    # an installed power per EEG_Anlagenschlüssel like etl_EEG_data does
+    seen = set()
+    chunks = []
+    reader = pd.read_csv(path, sep=';', encoding='ISO-8859-1', usecols=EEG_USECOLS, dtype=EEG_DTYPES, chunksize=chunksize)
+    for chunk in reader:
+        chunk['Installierte_Leistung'] = pd.to_numeric(chunk['Installierte_Leistung'].str.replace(',', ''), errors='coerce')
+        chunk = chunk.dropna(subset=['Installierte_Leistung'])
+        chunk = chunk.drop_duplicates(subset='EEG_Anlagenschlüssel')
+        chunk = chunk[~chunk['EEG_Anlagenschlüssel'].isin(seen)]
+        seen.update(chunk['EEG_Anlagenschlüssel'])
+        chunks.append(chunk)
+    return concat_categorical(chunks)
+
+def concat_categorical(frames:list)->pd.DataFrame:
+    # pd.concat turns categoricals with different categories into object, so union them
+    frames = [frame for frame in frames if frame is not None and not frame.empty]
+    if not frames:
+        return pd.DataFrame()
+    categorical = [col for col, dtype in frames[0].dtypes.items() if isinstance(dtype, pd.CategoricalDtype)]
+    df = pd.concat([frame.drop(columns=categorical) for frame in frames], ignore_index=True)
+    for col in categorical:
+        df[col] = union_categoricals([frame[col] for frame in frames])
+    return df[frames[0].columns]
+
+def download_eeg_historical_data(cache=None, output_path:str=EEG_HISTORICAL_PATH)->pd.DataFrame:
+    df_2021 = download_eeg_data('2021', cache=cache)
+    df_2022 = download_eeg_data('2022', cache=cache)
+    all_data = concat_categorical([df_2021, df_2022])
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    all_data.to_parquet(output_path, index=False)
+    return all_data
 
 if __name__ == '__main__':
     download_curtailment_historical_data('2022-12-31')
@@ -0,0 +1,147 @@
+import functools
+import inspect
+import json
+import logging
+import numbers
+import os
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# One JSON line per stage. Airflow routes the root logger into the task log, so the lines show up there.
+logger = logging.getLogger('curtailment.etl')
+
+# Append every record as a JSON line to this file, e.g. to collect the stages of all tasks of a DAG run
+METRICS_PATH_ENV = 'CURTAILMENT_METRICS_PATH'
+# Set to 1 to trace Python allocations per stage with tracemalloc (slows the stages down)
+TRACEMALLOC_ENV = 'CURTAILMENT_TRACEMALLOC'
+
+_records = []
+_lock = threading.Lock()
+_local = threading.local()
+
+def _peak_rss_mb():
+    # High-water mark of the process so far; ru_maxrss is in KB on Linux and bytes on macOS
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if os.uname().sysname == 'Darwin' else 1024), 1)
+
+def _rows(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return len(value)
+    # Stages that load out of core return the number of rows
+    if isinstance(value, numbers.Integral) and not isinstance(value, bool):
+        return int(value)
+    return None
+
+def _rows_in(signature, rows_arg, args, kwargs):
+    if rows_arg is not None:
+        value = signature.bind_partial(*args, **kwargs).arguments.get(rows_arg)
+        return len(value) if isinstance(value, (pd.DataFrame, pd.Series)) else None
+    # Rows of the first DataFrame argument, the main input of the stage
+    for value in list(args) + list(kwargs.values()):
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            return len(value)
+    return None
+
+def _trace_enter():
+    stack = getattr(_local, 'peaks', None)
+    if stack is None:
+        stack = _local.peaks = []
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    if stack:
+        # Keep the peak of the enclosing stage before resetting it for this one
+        stack[-1] = max(stack[-1], tracemalloc.get_traced_memory()[1])
+    tracemalloc.reset_peak()
+    stack.append(0)
+
+def _trace_exit():
+    stack = _local.peaks
+    peak = max(stack.pop(), tracemalloc.get_traced_memory()[1])
+    if stack:
+        stack[-1] = max(stack[-1], peak)
+    return round(peak / 2**20, 1)
+
+def record_metrics(record:dict):
+    with _lock:
+        _records.append(record)
+    line = json.dumps(record, default=str)
+    logger.info('stage_metrics %s', line)
+    path = os.environ.get(METRICS_PATH_ENV)
+    if path:
+        with _lock, open(path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+
+def instrument(stage:str=None, rows_arg:str=None, trace_memory:bool=None):
+    """
+    Decorator recording wall time, rows in/out, rows/sec and memory of a pipeline stage.
+
+    rows_in counts the argument named rows_arg, by default the first DataFrame argument;
+    rows_out counts the returned DataFrame, or is the returned number of rows.
+    peak_rss_mb is the process high-water mark after the stage, traced_peak_mb the
+    tracemalloc peak during the stage when tracing is enabled (trace_memory or
+    CURTAILMENT_TRACEMALLOC=1). The tracemalloc peak is process-wide, so stages
+    running outside the main thread (e.g. the download windows of a thread pool)
+    record traced_peak_mb as null instead of resetting each other's peaks.
+    """
+    def decorator(function):
+        name = stage or function.__name__
+        signature = inspect.signature(function)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            trace = trace_memory if trace_memory is not None else os.environ.get(TRACEMALLOC_ENV) == '1'
+            record = {
+                'stage': name,
+                'started_at': datetime.now().isoformat(timespec='seconds'),
+                'rows_in': _rows_in(signature, rows_arg, args, kwargs),
+            }
+            traced = trace and threading.current_thread() is threading.main_thread()
+            if traced:
+                _trace_enter()
+            tic = time.perf_counter()
+            status = 'error'
+            try:
+                result = function(*args, **kwargs)
+                status = 'ok'
+                return result
+            finally:
+                seconds = time.perf_counter() - tic
+                rows_out = _rows(result) if status == 'ok' else None
+                rows = rows_out if rows_out is not None else record['rows_in']
+                record.update({
+                    'status': status,
+                    'seconds': round(seconds, 3),
+                    'rows_out': rows_out,
+                    'rows_per_sec': round(rows / seconds) if rows is not None and seconds > 0 else None,
+                    'peak_rss_mb': _peak_rss_mb(),
+                })
+                if trace:
+                    record['traced_peak_mb'] = _trace_exit() if traced else None
+                record_metrics(record)
+        return wrapper
+    return decorator
+
+def collected_metrics()->list:
+    # Records of the stages run in this process so far
+    with _lock:
+        return list(_records)
+
+def reset_metrics():
+    with _lock:
+        _records.clear()
+
+def export_metrics(path:str)->str:
+    # Write the records of this process as a JSON array
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(collected_metrics(), f, indent=2, default=str)
+    return path
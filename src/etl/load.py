@@ -1,6 +1,17 @@
 import os
 import sqlite3
+import time
+import numpy as np
 import pandas as pd
+from itertools import repeat
+from utils import recalculate_curtailment_energy_matrix
+from .storage import READY_PATH, read_partitioned
+from .instrumentation import instrument
+
+# Slot frequencies pre-aggregated into CurtailmentRollup
+ROLLUP_FREQS = ('H', 'D')
+# Curtailment columns the rollup is computed from
+ROLLUP_COLUMNS = ['Anlagenschlüssel', 'Start', 'Ende', 'curtailment_power']
 
 def database_setup(db_name="../../database/power_data.db"):
     try:
@@ -24,13 +35,33 @@ def database_setup(db_name="../../database/power_data.db"):
                     curtailment_power REAL
                 )
             ''')
+            # Per-plant and per-area lookups of the dashboard
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_curtailment_anlagenschluessel_start ON Curtailment (Anlagenschlüssel, Start)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_curtailment_gebiet_start ON Curtailment (Gebiet, Start)')
+            # Non-zero curtailment energy per plant and hourly/daily slot, maintained by upsert_data and insert_with_temp_table
+            rollup_exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='CurtailmentRollup'").fetchone()
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS CurtailmentRollup (
+                    Anlagenschlüssel TEXT,
+                    freq TEXT,
+                    TimeSlot TIMESTAMP,
+                    curtailment_energy REAL,
+                    PRIMARY KEY (Anlagenschlüssel, freq, TimeSlot)
+                ) WITHOUT ROWID
+            ''')
+            # A database loaded before the rollup existed gets it filled from the stored events
+            if not rollup_exists and cursor.execute('SELECT 1 FROM Curtailment LIMIT 1').fetchone():
+                _rebuild_rollup(conn, 'Curtailment', 'CurtailmentRollup')
             conn.commit()
     except sqlite3.Error as e:
         print(f"Database error: {e}")
     except Exception as e:
         print(f"Exception in _query: {e}")
 
-def insert_with_temp_table(df, db_name="../../database/power_data.db", table_name="Curtailment", primary_key_col="ID"):
+@instrument()
+def insert_with_temp_table(df, db_name="../../database/power_data.db", table_name="Curtailment", primary_key_col="ID", rollup_table="CurtailmentRollup"):
+    # Insert the rows whose primary key is not stored yet; the rollup gets the slots of these rows
+    # (rollup_table=None skips this)
     try:
         with sqlite3.connect(db_name) as conn:
             # Create a temporary table
@@ -38,12 +69,16 @@ def insert_with_temp_table(df, db_name="../../database/power_data.db", table_nam
 
             # Prepare and execute the SQL query for inserting data
             columns = ', '.join(df.columns)
+            new_rows = f'SELECT {{}} FROM temp_table WHERE {primary_key_col} NOT IN (SELECT {primary_key_col} FROM {table_name})'
+            if rollup_table is not None:
+                df_new = pd.read_sql_query(new_rows.format(', '.join(ROLLUP_COLUMNS)), conn)
             query = f'''
             INSERT INTO {table_name} ({columns})
-            SELECT {columns} FROM temp_table 
-            WHERE {primary_key_col} NOT IN (SELECT {primary_key_col} FROM {table_name})
+            {new_rows.format(columns)}
             '''
             conn.execute(query)
+            if rollup_table is not None:
+                update_curtailment_rollup(conn, df_new, rollup_table=rollup_table)
 
             # Drop the temporary table
             conn.execute('DROP TABLE temp_table')
@@ -54,9 +89,129 @@ def insert_with_temp_table(df, db_name="../../database/power_data.db", table_nam
     except Exception as e:
         print(f"Exception in _query: {e}")
 
+def _sqlite_rows(df):
+    # Python values for sqlite3: timestamps as 'YYYY-MM-DD HH:MM:SS' text like to_sql, NaN/NaT as NULL
+    df = df.copy()
+    for col in df.select_dtypes(include=['datetime64[ns]']).columns:
+        text = np.char.replace(np.datetime_as_string(df[col].to_numpy(), unit='s'), 'T', ' ')
+        df[col] = np.where(df[col].isna(), None, text)
+    df = df.astype(object).where(df.notna(), None)
+    return list(df.itertuples(index=False, name=None))
+
+def _rollup_rows(df, freq):
+    # (Anlagenschlüssel, freq, TimeSlot, energy) of the non-zero slots of the events in df
+    plant_keys, slot_times, energy = recalculate_curtailment_energy_matrix(df, freq, sparse_output=True)
+    energy = energy.tocoo()
+    return list(zip(plant_keys[energy.row].tolist(), repeat(freq), slot_times[energy.col].strftime('%Y-%m-%d %H:%M:%S'), energy.data.tolist()))
+
+def update_curtailment_rollup(conn, df_new, df_old=None, rollup_table="CurtailmentRollup"):
+    # Apply the change of replacing the events df_old (the stored versions of upserted rows) by df_new.
+    # The energy of a slot is the sum over its events, so only the slots of these rows are touched:
+    # the old events are subtracted, the new ones added, and slots that drop to zero are deleted.
+    # The cost follows the size of the batch, not the history already loaded.
+    frames = [df_new[ROLLUP_COLUMNS].assign(curtailment_power=df_new['curtailment_power'].astype(float))]
+    if df_old is not None and len(df_old):
+        frames.append(df_old[ROLLUP_COLUMNS].assign(curtailment_power=-df_old['curtailment_power'].astype(float)))
+    # Stored rows hold the timestamps as text
+    frames = [frame.assign(Start=pd.to_datetime(frame['Start']), Ende=pd.to_datetime(frame['Ende'])) for frame in frames]
+    df = pd.concat(frames, ignore_index=True)
+    if df.empty:
+        return
+    for freq in ROLLUP_FREQS:
+        rows = _rollup_rows(df, freq)
+        conn.executemany(f'''
+            INSERT INTO {rollup_table} (Anlagenschlüssel, freq, TimeSlot, curtailment_energy) VALUES (?, ?, ?, ?)
+            ON CONFLICT(Anlagenschlüssel, freq, TimeSlot) DO UPDATE SET curtailment_energy = curtailment_energy + excluded.curtailment_energy
+        ''', rows)
+        # Only slots that lost energy can drop to zero (up to floating point residue)
+        conn.executemany(f'''
+            DELETE FROM {rollup_table}
+            WHERE Anlagenschlüssel = ? AND freq = ? AND TimeSlot = ? AND ABS(curtailment_energy) < 1e-9
+        ''', [row[:3] for row in rows if row[3] < 0])
 
+def _rebuild_rollup(conn, table_name, rollup_table):
+    df = pd.read_sql_query(f'SELECT {", ".join(ROLLUP_COLUMNS)} FROM {table_name}', conn)
+    conn.execute(f'DELETE FROM {rollup_table}')
+    update_curtailment_rollup(conn, df, rollup_table=rollup_table)
+
+def rebuild_curtailment_rollup(db_name="../../database/power_data.db", table_name="Curtailment", rollup_table="CurtailmentRollup"):
+    # Fill the rollup from all events, for data loaded before it existed or with rollup_table=None
+    try:
+        with sqlite3.connect(db_name) as conn:
+            _rebuild_rollup(conn, table_name, rollup_table)
+            conn.commit()
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+
+@instrument()
+def upsert_data(df, db_name="../../database/power_data.db", table_name="Curtailment", primary_key_col="ID", batch_size=50_000, rollup_table="CurtailmentRollup", timeout=60.0, raise_errors=False):
+    # Insert new rows and update existing ones by primary key, one transaction per batch.
+    # The rollup slots of each batch are updated in the same transaction (rollup_table=None skips this,
+    # rebuild_curtailment_rollup fills it afterwards).
+    # timeout is how long to wait for concurrent writers, raise_errors re-raises after printing.
+    columns = list(df.columns)
+    updates = ', '.join(f'{col}=excluded.{col}' for col in columns if col != primary_key_col)
+    query = f'''
+    INSERT INTO {table_name} ({', '.join(columns)})
+    VALUES ({', '.join('?' * len(columns))})
+    ON CONFLICT({primary_key_col}) DO UPDATE SET {updates}
+    '''
+    # Stored versions of the batch rows, found through the primary key instead of counting the table
+    stored = ROLLUP_COLUMNS if rollup_table is not None else [primary_key_col]
+    stored_query = f'SELECT {", ".join("t." + col for col in stored)} FROM {table_name} t JOIN upsert_keys k ON t.{primary_key_col} = k.key'
+    try:
+        tic = time.perf_counter()
+        inserted = updated = 0
+        with sqlite3.connect(db_name, timeout=timeout) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TEMP TABLE IF NOT EXISTS upsert_keys (key PRIMARY KEY)')
+            for batch_start in range(0, len(df), batch_size):
+                batch = df.iloc[batch_start:batch_start + batch_size]
+                keys = batch[primary_key_col].drop_duplicates()
+                conn.execute('DELETE FROM upsert_keys')
+                conn.executemany('INSERT INTO upsert_keys VALUES (?)', ((key,) for key in keys.tolist()))
+                df_old = pd.read_sql_query(stored_query, conn)
+                # Rows repeating a key within the batch count once
+                inserted += len(keys) - len(df_old)
+                updated += len(df_old)
+                conn.executemany(query, _sqlite_rows(batch))
+                if rollup_table is not None:
+                    # The last row of a duplicated key is the one stored
+                    update_curtailment_rollup(conn, batch.drop_duplicates(primary_key_col, keep='last'), df_old, rollup_table)
+                conn.commit()
+        elapsed = time.perf_counter() - tic
+        stats = {
+            'rows': len(df),
+            'inserted': inserted,
+            'updated': updated,
+            'seconds': round(elapsed, 3),
+            'rows_per_sec': round(len(df) / elapsed) if elapsed > 0 else None,
+        }
+        print(f"upsert done: {stats}")
+        return stats
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+        if raise_errors:
+            raise
+    except Exception as e:
+        print(f"Exception in _query: {e}")
+        if raise_errors:
+            raise
+
+def get_curtailment_watermark(db_name="../../database/power_data.db", table_name="Curtailment"):
+    # Newest Start already loaded, None for an empty or missing table
+    try:
+        with sqlite3.connect(db_name) as conn:
+            watermark = conn.execute(f'SELECT MAX(Start) FROM {table_name}').fetchone()[0]
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+        return None
+    return None if watermark is None else pd.Timestamp(watermark)
 
 if __name__=="__main__":
-    df_ready = pd.read_csv("../../data/df_ready.csv")
-    database_setup()
-    insert_with_temp_table(df_ready)
+    # Independent of the working directory, like the DAGs
+    db_path = os.path.join(os.path.dirname(__file__), '..', '..', 'database', 'power_data.db')
+    df_ready = read_partitioned(READY_PATH)
+    database_setup(db_path)
+    upsert_data(df_ready, db_name=db_path)
@@ -1,20 +1,67 @@
 import pandas as pd
 import numpy as np
+from .storage import CURTAILMENT_ETL_PATH, CURTAILMENT_HISTORICAL_PATH, EEG_HISTORICAL_PATH, READY_PATH, delete_partitions, iter_partitioned, partition_months, read_partitioned, write_partitioned
+from .instrumentation import instrument
 
 def get_mode_or_default(series, default_value):
     return series.mode()[0] if not series.mode().empty else default_value
 
-def etl_curtailment_data(df:pd.DataFrame)->pd.DataFrame:
+def _modes(counts:pd.DataFrame)->pd.Series:
+    # Mode per key from the columns key, value, count. Ties go to the smallest value as in Series.mode.
+    counts = counts[counts['count'] > 0].sort_values(['key', 'count', 'value'], ascending=[True, False, True], kind='stable')
+    return counts.drop_duplicates('key').set_index('key')['value']
+
+def mode_per_group(keys:pd.Series, values:pd.Series, default_value)->pd.Series:
+    # Per-row mode of values within its key, like groupby(keys).transform(get_mode_or_default)
+    # but from one value_counts over (key, value)
+    counts = pd.DataFrame({'key': keys, 'value': values}).value_counts(sort=False).reset_index(name='count')
+    return keys.map(_modes(counts)).fillna(default_value)
+
+# Raw columns read by curtailment_modes
+CURTAILMENT_MODE_COLUMNS = ['Anlagenschlüssel', 'Start', 'Ende', 'Stufe (%)', 'Dauer (Min)']
+
+def curtailment_modes(chunks)->tuple:
+    # Per-plant 'Stufe (%)' modes and the 'Dauer (Min)' mode over all chunks of raw curtailment data,
+    # so that etl_curtailment_data fills every chunk like the whole history at once
+    stufe_counts, dauer_counts = [], []
+    for chunk in chunks:
+        chunk = chunk.dropna(subset=['Anlagenschlüssel', 'Start', 'Ende'])
+        stufe_counts.append(pd.DataFrame({'key': chunk['Anlagenschlüssel'], 'value': chunk['Stufe (%)']}).value_counts(sort=False))
+        dauer_counts.append(chunk['Dauer (Min)'].value_counts())
+    if not stufe_counts:
+        return pd.Series(dtype=float), 8
+    stufe = pd.concat(stufe_counts).groupby(level=[0, 1]).sum().reset_index(name='count')
+    dauer = pd.concat(dauer_counts).groupby(level=0).sum()
+    dauer_mode = dauer.index[dauer == dauer.max()].min() if len(dauer) else 8
+    return _modes(stufe), dauer_mode
+
+def fill_unknown(df:pd.DataFrame)->pd.DataFrame:
+    # 'Unknown' for missing text, numeric and datetime columns keep their dtype and NaN
+    for col in df.columns[df.isna().any()]:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            if 'Unknown' not in df[col].cat.categories:
+                df[col] = df[col].cat.add_categories('Unknown')
+            df[col] = df[col].fillna('Unknown')
+        elif df[col].dtype == object or pd.api.types.is_string_dtype(df[col].dtype):
+            df[col] = df[col].fillna('Unknown')
+    return df
+
+@instrument()
+def etl_curtailment_data(df:pd.DataFrame, modes:tuple=None)->pd.DataFrame:
+    # modes from curtailment_modes when df is one chunk of a longer history
     df = df.drop(columns=['Einsatz-ID', 'Ursache', 'Entschädigungspflicht'])
     df = df.dropna(subset=['Anlagenschlüssel', 'Start', 'Ende'])
 
-    mode_per_group = df.groupby('Anlagenschlüssel')['Stufe (%)'].transform(lambda x: get_mode_or_default(x, 30))
-    df['Stufe (%)'] = df['Stufe (%)'].fillna(mode_per_group)
-
-    mode_value = get_mode_or_default(df['Dauer (Min)'], 8)
+    if modes is None:
+        df['Stufe (%)'] = df['Stufe (%)'].fillna(mode_per_group(df['Anlagenschlüssel'], df['Stufe (%)'], 30))
+        counts = df['Dauer (Min)'].value_counts()
+        mode_value = counts.index[counts == counts.max()].min() if len(counts) else 8
+    else:
+        stufe_modes, mode_value = modes
+        df['Stufe (%)'] = df['Stufe (%)'].fillna(df['Anlagenschlüssel'].map(stufe_modes).fillna(30))
     df['Dauer (Min)'] = df['Dauer (Min)'].fillna(mode_value)
 
-    df.fillna('Unknown', inplace=True)
+    df = fill_unknown(df)
 
     df['Start'] = pd.to_datetime(df['Start'], errors='coerce')
     df['Ende'] = pd.to_datetime(df['Ende'], errors='coerce')
@@ -30,16 +77,42 @@ def etl_curtailment_data(df:pd.DataFrame)->pd.DataFrame:
     }) 
     return df
 
+def etl_curtailment_partitions(raw_path:str=CURTAILMENT_HISTORICAL_PATH, output_path:str=CURTAILMENT_ETL_PATH, months:list=None)->str:
+    # etl_curtailment_data of the raw month partitions one month at a time into a typed dataset.
+    # The fill modes are taken over the whole raw history first, also when only some 'YYYY-MM' months
+    # are processed, so the stored values do not depend on which months a run covers.
+    # A month without raw rows removes its ETL partition. Returns output_path.
+    modes = curtailment_modes(iter_partitioned(raw_path, columns=CURTAILMENT_MODE_COLUMNS))
+    raw_months = partition_months(raw_path)
+    for month in raw_months if months is None else months:
+        df = etl_curtailment_data(read_partitioned(raw_path, months=[month]), modes) if month in raw_months else pd.DataFrame()
+        if df.empty:
+            delete_partitions(output_path, [month])
+        else:
+            write_partitioned(df, output_path)
+    return output_path
+
+def _as_str(series):
+    # Categoricals from read_eeg_data already hold strings
+    return series if isinstance(series.dtype, pd.CategoricalDtype) else series.astype(str)
+
+@instrument()
 def etl_EEG_data(df):
-    df = df.drop(columns=['Straße_Flurstück', 'Ort_Gemarkung', 'Einspeisespannungsebene', 'Leistungsmessung', 'Außerbetriebnahme', 'Netzzugang', 'Netzabgang'])
+    # Columns may already be pruned by etl.extract.read_eeg_data
+    df = df.drop(columns=['Straße_Flurstück', 'Ort_Gemarkung', 'Einspeisespannungsebene', 'Leistungsmessung', 'Außerbetriebnahme', 'Netzzugang', 'Netzabgang'], errors='ignore')
     df = df.dropna(subset=['Installierte_Leistung'])
     df = df.drop_duplicates(subset='EEG_Anlagenschlüssel')
+    for col in df.select_dtypes('category').columns:
+        if 'Unknown' not in df[col].cat.categories:
+            df[col] = df[col].cat.add_categories('Unknown')
     df.fillna('Unknown', inplace=True)
 
     df['Inbetriebnahme'] = pd.to_datetime(df['Inbetriebnahme'], errors='coerce')
-    df['NB_BNR'] = df['NB_BNR'].astype(str)
-    df['Gemeindeschlüssel'] = df['Gemeindeschlüssel'].astype(str)
-    df['Installierte_Leistung'] = df['Installierte_Leistung'].str.replace(',', '').astype(int)
+    df['NB_BNR'] = _as_str(df['NB_BNR'])
+    df['Gemeindeschlüssel'] = _as_str(df['Gemeindeschlüssel'])
+    if df['Installierte_Leistung'].dtype == object:
+        df['Installierte_Leistung'] = df['Installierte_Leistung'].str.replace(',', '')
+    df['Installierte_Leistung'] = df['Installierte_Leistung'].astype(int)
     df['EEG_Anlagenschlüssel'] = df['EEG_Anlagenschlüssel'].astype(str)
 
     df.rename(columns={
@@ -50,21 +123,53 @@ def etl_EEG_data(df):
     df['nominal_power'] = df['nominal_power'] / 1000  # Convert to kW
     return df
 
-def merge_and_calculate(df_curtailment_etl:pd.DataFrame, df_eeg_etl:pd.DataFrame)->pd.DataFrame:
-    df_ready = pd.merge(df_curtailment_etl, df_eeg_etl[['Anlagenschlüssel','nominal_power']], on='Anlagenschlüssel', how='inner')
+def nominal_power_lookup(df_eeg_etl:pd.DataFrame)->pd.Series:
+    # nominal_power by plant key, the hash index maps curtailment keys in one get_indexer call
+    eeg = df_eeg_etl.drop_duplicates('Anlagenschlüssel')
+    return pd.Series(eeg['nominal_power'].to_numpy(), index=pd.Index(eeg['Anlagenschlüssel'].astype(str)))
+
+def merge_chunk(df_curtailment_etl:pd.DataFrame, lookup:pd.Series)->pd.DataFrame:
+    # Inner join of curtailment rows with the lookup, the rows keep their curtailment order
+    position = lookup.index.get_indexer(df_curtailment_etl['Anlagenschlüssel'].astype(str))
+    found = position >= 0
+    df_ready = df_curtailment_etl[found].reset_index(drop=True)
+    df_ready['nominal_power'] = lookup.to_numpy()[position[found]]
     df_ready['curtailment_power'] = (100-df_ready['Stufe']) * df_ready['nominal_power']/100
-    df_ready.to_csv("../../data/df_ready.csv",index=False)
     return df_ready
 
+@instrument()
+def merge_and_calculate(df_curtailment_etl:pd.DataFrame, df_eeg_etl:pd.DataFrame, output_path:str=READY_PATH)->pd.DataFrame:
+    df_ready = merge_chunk(df_curtailment_etl, nominal_power_lookup(df_eeg_etl))
+    # output_path=None skips the intermediate file when the caller loads df_ready directly
+    if output_path is not None and not df_ready.empty:
+        write_partitioned(df_ready, output_path)
+    return df_ready
+
+@instrument(rows_arg='curtailment_chunks')
+def merge_and_calculate_chunked(curtailment_chunks, df_eeg_etl:pd.DataFrame, load)->int:
+    # Out-of-core merge_and_calculate: every etl'd curtailment chunk is joined against the plant lookup
+    # and handed to load (e.g. etl.load.upsert_data, which only reads back the stored versions of the chunk rows
+    # for its rollup), so memory is bounded by the chunk size.
+    # Returns the number of rows loaded.
+    lookup = nominal_power_lookup(df_eeg_etl)
+    rows = 0
+    for chunk in curtailment_chunks:
+        df_ready = merge_chunk(chunk, lookup)
+        if not df_ready.empty:
+            load(df_ready)
+            rows += len(df_ready)
+    return rows
+
 
 if __name__=='__main__':
-    df_curtailment = pd.read_csv('../../data/curtailment_historical.csv')
-    df_eeg = pd.read_csv('../../data/eeg_historical.csv')
+    df_curtailment = read_partitioned(CURTAILMENT_HISTORICAL_PATH)
+    df_eeg = pd.read_parquet(EEG_HISTORICAL_PATH)
     print("curtilment data:", df_curtailment.head(3))
     print("eeg data:" , df_curtailment.head(3))
     df_curtailment_etl = etl_curtailment_data(df_curtailment)
     df_eeg_etl = etl_EEG_data(df_eeg)
     df_ready = merge_and_calculate(df_curtailment_etl, df_eeg_etl)
     print("ready to insert:" , df_ready.head(3))
+    write_partitioned(df_ready, READY_PATH)
    
 
@@ -0,0 +1,57 @@
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+# Set CURTAILMENT_DATA_DIR to a shared volume when Airflow tasks run on separate workers,
+# the tasks only pass paths below it to each other
+DATA_DIR = os.environ.get('CURTAILMENT_DATA_DIR', os.path.join(os.path.dirname(__file__), '..', '..', 'data'))
+CURTAILMENT_HISTORICAL_PATH = os.path.join(DATA_DIR, 'curtailment_historical')
+CURTAILMENT_ETL_PATH = os.path.join(DATA_DIR, 'curtailment_etl')
+# One Parquet file of etl'd new curtailment rows per daily run
+CURTAILMENT_DAILY_DIR = os.path.join(DATA_DIR, 'curtailment_daily')
+EEG_HISTORICAL_PATH = os.path.join(DATA_DIR, 'eeg_historical.parquet')
+EEG_ETL_PATH = os.path.join(DATA_DIR, 'eeg_etl.parquet')
+READY_PATH = os.path.join(DATA_DIR, 'df_ready')
+
+# Hive-style partition column added on write and removed again on read
+PARTITION_COL = 'month'
+
+def month_labels(values:pd.Series)->pd.Categorical:
+    # 'YYYY-MM' per row; only the distinct months are formatted
+    times = pd.to_datetime(values, errors='coerce')
+    codes, months = pd.factorize(times.dt.year * 100 + times.dt.month)
+    labels = [f'{int(month) // 100:04d}-{int(month) % 100:02d}' for month in months]
+    if (codes < 0).any():
+        codes = np.where(codes < 0, len(labels), codes)
+        labels.append('unknown')
+    return pd.Categorical.from_codes(codes, labels)
+
+def write_partitioned(df:pd.DataFrame, path:str, time_col:str='Start')->None:
+    # Write a typed Parquet dataset with one directory per month of time_col.
+    # Only the months present in df are replaced, so rewriting a month is idempotent.
+    df = df.assign(**{PARTITION_COL: month_labels(df[time_col])})
+    df.to_parquet(path, partition_cols=[PARTITION_COL], index=False, existing_data_behavior='delete_matching')
+
+def delete_partitions(path:str, months:list)->None:
+    # Remove the given 'YYYY-MM' months, e.g. when a rerun finds no rows for them any more
+    for month in months:
+        shutil.rmtree(os.path.join(path, f'{PARTITION_COL}={month}'), ignore_errors=True)
+
+def read_partitioned(path:str, months:list=None, columns:list=None)->pd.DataFrame:
+    # Read the whole dataset or only the given 'YYYY-MM' months
+    filters = [(PARTITION_COL, 'in', list(months))] if months is not None else None
+    df = pd.read_parquet(path, columns=columns, filters=filters)
+    return df.drop(columns=[PARTITION_COL], errors='ignore')
+
+def partition_months(path:str)->list:
+    # 'YYYY-MM' labels of the month partitions in the dataset, in order
+    if not os.path.isdir(path):
+        return []
+    prefix = f'{PARTITION_COL}='
+    return sorted(name[len(prefix):] for name in os.listdir(path) if name.startswith(prefix))
+
+def iter_partitioned(path:str, columns:list=None):
+    # Yield the dataset one month at a time, memory is bounded by the largest month
+    for month in partition_months(path):
+        yield read_partitioned(path, months=[month], columns=columns)
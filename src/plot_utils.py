@@ -1,15 +1,53 @@
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
+from utils import CompactTimeline, profile_statistics
 
-def plot_data(df_timeline, selected_anlagenschlüssel):
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+def downsample_minmax(x, y, n_buckets):
+    # Indices of the min and max of y in each of n_buckets equal-width x buckets plus the
+    # end points, so that peaks survive while at most ~2 points per pixel column are sent
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n <= 2 * n_buckets:
+        return np.arange(n)
+    x_ns = pd.to_datetime(x).to_numpy(dtype='datetime64[ns]').view(np.int64)
+    bucket = ((x_ns - x_ns[0]) / (x_ns[-1] - x_ns[0] + 1) * n_buckets).astype(np.int64)
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    segment = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, n]))
+    keep = [np.array([0, n - 1])]
+    for extreme in (np.minimum.reduceat(y, starts), np.maximum.reduceat(y, starts)):
+        candidates = np.flatnonzero(y == extreme[segment])
+        # First index reaching the extreme in every bucket
+        keep.append(candidates[np.r_[True, segment[candidates][1:] != segment[candidates][:-1]]])
+    return np.unique(np.concatenate(keep))
+
+def plot_data(df_timeline, selected_anlagenschlüssel, x_range=None, width=800):
+    # x_range: optional (start, end) zoom window, drawn at up to full resolution
+    if isinstance(df_timeline, CompactTimeline):
+        # Only the slots around curtailment runs are needed to draw the lines
+        tickvals = df_timeline.slot_times(np.arange(0, len(df_timeline), max(len(df_timeline)//12, 1)))
+        df_timeline = df_timeline.line_points()
+    else:
+        tickvals = df_timeline['TimeSlot'][::max(len(df_timeline)//12, 1)]
+    tickformat = '%Y-%m'
+    if x_range is not None:
+        x_start, x_end = pd.Timestamp(x_range[0]), pd.Timestamp(x_range[1])
+        df_timeline = df_timeline[(df_timeline['TimeSlot'] >= x_start) & (df_timeline['TimeSlot'] <= x_end)]
+        tickvals = pd.date_range(x_start, x_end, periods=13)
+        tickformat = '%Y-%m-%d'
+    # Bound the payload by the plot width instead of the number of slots
+    power = df_timeline.iloc[downsample_minmax(df_timeline['TimeSlot'], df_timeline['curtailment_power'], width)]
+    energy = df_timeline.iloc[downsample_minmax(df_timeline['TimeSlot'], df_timeline['cumulative_energy'], width)]
     # Create a figure
     fig = go.Figure()
 
     # Add line plot for curtailment power
-    fig.add_trace(go.Scatter(x=df_timeline['TimeSlot'], y=df_timeline['curtailment_power'], name='Power', mode='lines', yaxis='y'))
+    fig.add_trace(go.Scatter(x=power['TimeSlot'], y=power['curtailment_power'], name='Power', mode='lines', yaxis='y'))
 
     # Add line plot for cumulative curtailed energy
-    fig.add_trace(go.Scatter(x=df_timeline['TimeSlot'], y=df_timeline['cumulative_energy'], name='Energy', mode='lines', yaxis='y2'))
+    fig.add_trace(go.Scatter(x=energy['TimeSlot'], y=energy['cumulative_energy'], name='Energy', mode='lines', yaxis='y2'))
 
     # Update layout
     fig.update_layout(
@@ -18,8 +56,8 @@ def plot_data(df_timeline, selected_anlagenschlüssel):
         xaxis=dict(
             title='date',
             tickmode='array',
-            tickvals=df_timeline['TimeSlot'][::len(df_timeline)//12],  # Adjust to show fewer x-axis labels
-            tickformat='%Y-%m',
+            tickvals=tickvals,  # Adjust to show fewer x-axis labels
+            tickformat=tickformat,
             tickangle=-45
         ),
         yaxis=dict(
@@ -32,7 +70,7 @@ def plot_data(df_timeline, selected_anlagenschlüssel):
             showgrid=False,  # Hide the gridlines for the secondary axis
         ),
         barmode='overlay',
-        width = 800,
+        width = width,
         height = 600,
         legend=dict(
             x=1,  
@@ -43,14 +81,11 @@ def plot_data(df_timeline, selected_anlagenschlüssel):
     return fig
 
 def plot_single_plant_weekday(df_in,selected_anlagenschlüssel):
-    df_timeline = df_in.copy()
-    df_timeline['weekday'] = df_timeline['TimeSlot'].dt.weekday
-    weekdays = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-    weekday_mapping = {day: name for day, name in enumerate(weekdays)}
-    df_timeline['weekday'] = pd.Categorical(df_timeline['weekday'].replace(weekday_mapping),
-                                            categories=weekdays, 
-                                            ordered=True)
-    df_show = df_timeline.groupby('weekday').mean().reset_index()
+    if isinstance(df_in, CompactTimeline):
+        weekday_mean = df_in.profile_mean('weekday')
+    else:
+        weekday_mean = profile_statistics(df_in['curtailment_power'], df_in['TimeSlot'])['weekday']['mean']
+    df_show = pd.DataFrame({'weekday': WEEKDAYS, 'curtailment_power': weekday_mean})
     # Create a figure
     fig = go.Figure()
     
@@ -64,7 +99,7 @@ def plot_single_plant_weekday(df_in,selected_anlagenschlüssel):
         xaxis=dict(
             title='date',
             tickmode='array',
-            tickvals= weekdays,
+            tickvals= WEEKDAYS,
         ),
         yaxis=dict(
             title='Power in kw',
@@ -80,9 +115,11 @@ def plot_single_plant_weekday(df_in,selected_anlagenschlüssel):
     return fig
 
 def plot_single_plant_hour(df_in,selected_anlagenschlüssel):
-    df_timeline = df_in.copy()
-    df_timeline['hour'] = df_timeline['TimeSlot'].dt.hour
-    df_show = df_timeline.groupby('hour').mean().reset_index()
+    if isinstance(df_in, CompactTimeline):
+        hour_mean = df_in.profile_mean('hour')
+    else:
+        hour_mean = profile_statistics(df_in['curtailment_power'], df_in['TimeSlot'])['hour']['mean']
+    df_show = pd.DataFrame({'hour': np.arange(24), 'curtailment_power': hour_mean})
     # Create a figure
     fig = go.Figure()
     
@@ -4,27 +4,96 @@ import matplotlib.pyplot as plt
 from statsmodels.tsa.arima.model import ARIMA
 from prophet import Prophet
 import seaborn as sns
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+try:
+    from ..croston._kernels import croston_standard, croston_tsb
+    from ..utils import CompactTimeline
+except ImportError:
+    # Imported as prediction.prediction with src/ on sys.path (benchmarks, Airflow)
+    from croston._kernels import croston_standard, croston_tsb
+    from utils import CompactTimeline
 
 def prediction_plot(df: pd.DataFrame, start_date: pd.Timestamp, method:str):
     df[['curtailment_power', 'curtailment_power_pred']].plot(figsize=(20, 6))
     plt.title(f'{method}'+' Prediction---MAE: {:.2f}'.format(np.mean(np.abs(df.loc[df.TimeSlot >= start_date, 'curtailment_power'] - df.loc[df.TimeSlot >= start_date, 'curtailment_power_pred']))))
     plt.show()
 
-def curtailment_power_prediction(df_in: pd.DataFrame, start_date: pd.Timestamp, method:str, plot=True) -> pd.DataFrame:
+def _fit_sparse(model, slot_index, values, n_slots, **fit_kwargs):
+    # Fit model to a series of n_slots periods that is zero except at slot_index,
+    # stepping over the runs of zeros in O(1) each
+    model.fit(values[:1] if len(slot_index) and slot_index[0] == 0 else np.zeros(1), **fit_kwargs)
+    position = 1
+    for slot, value in zip(slot_index, values):
+        if slot >= position:
+            model.update_zeros(slot - position)
+            model.update(value)
+            position = slot + 1
+    model.update_zeros(n_slots - position)
+    return model
+
+def _compact_backtest(timeline, start_date: pd.Timestamp, method:str, seed=None) -> pd.DataFrame:
+    # curtailment_power_prediction of a CompactTimeline: the models are fitted from the curtailed
+    # slots only and just the backtest window from start_date is materialized
+    first_target = max(int(np.ceil((pd.Timestamp(start_date) - timeline.start) / timeline.delta)), 0)
+    if first_target == 0 and timeline.n_slots:
+        raise ValueError("start_date must leave at least one time slot of training data")
+    # The values of to_frame, so both inputs give the same predictions
+    power = timeline.energy.astype(np.float64) * timeline.unit_factor
+    history = timeline.slot_index < first_target
+    window = np.zeros(max(timeline.n_slots - first_target, 0))
+    window[timeline.slot_index[~history] - first_target] = power[~history]
+    predictions = np.full(len(window), None, dtype=object)
+    if method == 'Naive' and len(window):
+        last = timeline.slot_index[history][-1:] == first_target - 1
+        predictions[:] = np.concatenate([power[history][-1:] if last.any() else [0.0], window[:-1]])
+    elif method in ('WSS', 'Croston') and len(window):
+        if method == 'WSS':
+            model = _fit_sparse(WSS(seed=seed), timeline.slot_index[history], power[history], first_target)
+            forecast = lambda: model.forecast(lead_time=1)[0]
+        else:
+            model = _fit_sparse(Croston(alpha=0.3,beta=0.2), timeline.slot_index[history], power[history], first_target, method='tsb')
+            forecast = lambda: model.forecast(steps=1)[0]
+        for target, value in enumerate(window):
+            predictions[target] = forecast()
+            model.update(value)
+    return pd.DataFrame({
+        'TimeSlot': timeline.slot_times(np.arange(first_target, timeline.n_slots)),
+        'curtailment_power': window,
+        'curtailment_power_pred': predictions,
+    })
+
+def curtailment_power_prediction(df_in, start_date: pd.Timestamp, method:str, plot=True, seed=None) -> pd.DataFrame:
+    # df_in is a timeline DataFrame or a CompactTimeline; for the latter the result only holds
+    # the slots from start_date on
+    if isinstance(df_in, CompactTimeline):
+        df = _compact_backtest(df_in, start_date, method, seed)
+        if plot:
+            prediction_plot(df, start_date, method)
+        return df
     df = df_in.copy()
-    df['curtailment_power_pred'] = None
-    #from start_date loop all time slots
-    for target_time in df.loc[df.TimeSlot >= start_date, 'TimeSlot']:
-        training_data = df[df.TimeSlot < target_time]['curtailment_power']
-        if method =='Naive':
-            prediction = df[df.TimeSlot < target_time]['curtailment_power'][-1]
-        elif method == 'WSS':
-            prediction =wss_forecast(training_data)
-        elif method =='Croston':
-            croston = Croston(alpha=0.3,beta=0.2)
-            croston.fit(training_data.values, method='tsb')
-            prediction = croston.forecast(steps=1)
-        df.loc[df.TimeSlot==target_time, 'curtailment_power_pred'] = prediction
+    # One-step-ahead walk-forward backtest over the time-sorted slots from start_date.
+    # Naive, WSS and Croston update their state with each observation instead of refitting.
+    values = df['curtailment_power'].to_numpy()
+    targets = np.flatnonzero((df.TimeSlot >= start_date).to_numpy())
+    if len(targets) and targets[0] == 0:
+        raise ValueError("start_date must leave at least one time slot of training data")
+    predictions = np.full(len(df), None, dtype=object)
+    if method =='Naive':
+        predictions[targets] = values[targets - 1]
+    elif method == 'WSS' and len(targets):
+        wss = WSS(seed=seed)
+        wss.fit(values[:targets[0]])
+        for target in targets:
+            predictions[target] = wss.forecast(lead_time=1)[0]
+            wss.update(values[target])
+    elif method =='Croston' and len(targets):
+        croston = Croston(alpha=0.3,beta=0.2)
+        croston.fit(values[:targets[0]], method='tsb')
+        for target in targets:
+            predictions[target] = croston.forecast(steps=1)[0]
+            croston.update(values[target])
+    df['curtailment_power_pred'] = predictions
     if plot:
         prediction_plot(df, start_date, method)
     return df
@@ -45,82 +114,190 @@ class Croston:
             self.a, self.p, self.f = self._croston_tsb(self.data, cols)
         else:
             raise ValueError("Invalid method specified. Use 'standard' or 'tsb'.")
+        self.method = method
         self.fitted = True
 
+    def update(self, observation):
+        """
+        Extend the fitted series by one observation in O(1).
+
+        The resulting forecast equals the one of a refit on the extended series.
+        """
+        if not self.fitted:
+            raise RuntimeError("Model not fitted. Call fit method first.")
+        step = self._standard_step if self.method == 'standard' else self._tsb_step
+        state = self._state
+        if self._first_occurrence is None and observation > 0:
+            # The first demand moves the initialization, replay the leading non-demand periods from it
+            self._first_occurrence = self._n
+            state = self._zero_steps(self._initial_state(observation, self._n), self._n)
+        self._state = step(state, observation)
+        self._n += 1
+
+    def update_zeros(self, periods:int):
+        """
+        Extend the fitted series by `periods` periods without demand in O(1),
+        like as many calls of update(0).
+        """
+        if not self.fitted:
+            raise RuntimeError("Model not fitted. Call fit method first.")
+        if periods > 0:
+            self._state = self._zero_steps(self._state, periods)
+            self._n += periods
+
+    def _zero_steps(self, state, periods):
+        # Closed form of `periods` steps without demand
+        a, p, f, q = state
+        if self.method == 'standard':
+            return a, p, f, q + periods
+        p = p * (1 - self.beta) ** periods
+        return a, p, p * a, q
+
     def forecast(self, steps=3):
         if not self.fitted:
             raise RuntimeError("Model not fitted. Call fit method first.")
-        return np.repeat(np.mean(self.f[-1]), steps)
+        return np.repeat(np.mean(self._state[2]), steps)
 
-    def _croston_standard(self, d, cols):
-        #level (a), periodicity (p) and forecast (f)
-        a, p, f = np.full((3, cols+1), np.nan)
-        q = 1  # periods since last demand observation
+    def _initial_state(self, first_demand, first_occurrence):
+        # level (a), periodicity/probability (p), forecast (f) and periods since last demand (q)
+        if self.method == 'standard':
+            a, p, q = first_demand, 1 + first_occurrence, 1
+            return a, p, a / p, q
+        a, p = first_demand, 1 / (1 + first_occurrence)
+        return a, p, p * a, 1
+
+    def _standard_step(self, state, d_t):
+        a, p, f, q = state
+        if d_t > 0:
+            a = self.alpha * d_t + (1 - self.alpha) * a
+            p = self.alpha * q + (1 - self.alpha) * p
+            f = a / p
+            q = 1
+        else:
+            q += 1
+        return a, p, f, q
+
+    def _tsb_step(self, state, d_t):
+        a, p, f, q = state
+        if d_t > 0:
+            a = self.alpha * d_t + (1 - self.alpha) * a
+            p = self.beta * 1 + (1 - self.beta) * p
+        else:
+            p = (1 - self.beta) * p
+        return a, p, p * a, q
+
+    def _run(self, d, cols, method):
+        self.method = method
+        d = np.asarray(d, dtype=np.float64)[:cols]
 
         # Initialization
         first_occurrence = np.argmax(d > 0)
-        a[0] = d[first_occurrence]
-        p[0] = 1 + first_occurrence
-        f[0] = a[0] / p[0]
-
-        # Create all the t+1 forecasts
-        for t in range(0, cols):        
-            if d[t] > 0:
-                a[t+1] = self.alpha * d[t] + (1 - self.alpha) * a[t]
-                p[t+1] = self.alpha * q + (1 - self.alpha) * p[t]
-                f[t+1] = a[t+1] / p[t+1]
-                q = 1           
-            else:
-                a[t+1] = a[t]
-                p[t+1] = p[t]
-                f[t+1] = f[t]
-                q += 1
+        state = self._initial_state(d[first_occurrence], first_occurrence)
+        self._first_occurrence = first_occurrence if d[first_occurrence] > 0 else None
+
+        # Create all the t+1 forecasts of level (a), periodicity/probability (p) and forecast (f)
+        if method == 'standard':
+            a, p, f, q = croston_standard(d, float(self.alpha), float(state[0]), float(state[1]), state[3])
+        else:
+            a, p, f = croston_tsb(d, float(self.alpha), float(self.beta), float(state[0]), float(state[1]))
+            q = state[3]
+        self._state = a[-1], p[-1], f[-1], q
+        self._n = cols
         return a, p, f
 
+    def _croston_standard(self, d, cols):
+        return self._run(d, cols, 'standard')
+
     def _croston_tsb(self, d, cols):
-        #level (a), probability (p) and forecast (f)
-        a, p, f = np.full((3, cols+1), np.nan)
+        return self._run(d, cols, 'tsb')
 
-        # Initialization
-        first_occurrence = np.argmax(d > 0)
-        a[0] = d[first_occurrence]
-        p[0] = 1 / (1 + first_occurrence)
-        f[0] = p[0] * a[0]
-
-        # Create all the t+1 forecasts
-        for t in range(0, cols):
-            if d[t] > 0:
-                a[t+1] = self.alpha * d[t] + (1 - self.alpha) * a[t]
-                p[t+1] = self.beta * 1 + (1 - self.beta) * p[t]
-            else:
-                a[t+1] = a[t]
-                p[t+1] = (1 - self.beta) * p[t]
-            f[t+1] = p[t+1]*a[t+1]
-        return a, p, f
+class WSS:
+    """
+    Markov-bootstrap forecast of intermittent demand (Willemain, Smart and Schwarz).
 
-def wss_forecast(df:pd.Series, lead_time=1, quantile=0.75, n_samples=1000)->int:
-    demand_data = df.copy()
-    # Convert demand data to a binary series
-    demand_binary = (demand_data > 0).astype(int)
+    Demand occurrence is a two-state Markov chain estimated from the transition
+    counts of the history, positive periods resample the observed positive
+    demands. The counts are updated with each new observation.
 
-    # Estimate transition probabilities
-    transition_matrix = pd.crosstab(demand_binary.shift(), demand_binary, normalize='index')
+    Parameters
+    ----------
+    seed
+        Seed of the numpy random Generator drawing the sample paths.
+    """
 
-    # Initialize forecast samples
-    forecasts = []
-    for _ in range(n_samples):
-        forecast = []
-        current_state = demand_binary.iloc[-1]
-        for _ in range(lead_time):
-            current_state = np.random.choice([0, 1], p=transition_matrix.loc[current_state])
-            if current_state == 1:
-                positive_demand_sample = np.random.choice(demand_data[demand_data > 0], 1)[0]
-                forecast.append(positive_demand_sample)
-            else:
-                forecast.append(0)
-        forecasts.append(forecast)
-
-    return np.quantile(forecasts, quantile, axis=0)
+    def __init__(self, seed=None):
+        self.rng = np.random.default_rng(seed)
+        self.fitted = False
+
+    def fit(self, ts:np.array):
+        values = np.asarray(ts, dtype=float)
+        # Convert demand data to a binary series and count the transitions previous -> current state
+        occurrence = (values > 0).astype(int)
+        self.counts = np.bincount(2 * occurrence[:-1] + occurrence[1:], minlength=4).reshape(2, 2)
+        positives = values[values > 0]
+        self._positives = np.empty(max(16, 2 * len(positives)))
+        self._positives[:len(positives)] = positives
+        self._n_positive = len(positives)
+        self._n = len(values)
+        self._state = occurrence[-1] if len(values) else 0
+        self.fitted = True
+
+    def update(self, observation):
+        """
+        Add one observation to the transition counts and positive demands in O(1).
+        """
+        if not self.fitted:
+            raise RuntimeError("Model not fitted. Call fit method first.")
+        state = int(observation > 0)
+        if self._n:
+            self.counts[self._state, state] += 1
+        if state:
+            if self._n_positive == len(self._positives):
+                self._positives = np.resize(self._positives, 2 * len(self._positives))
+            self._positives[self._n_positive] = observation
+            self._n_positive += 1
+        self._state = state
+        self._n += 1
+
+    def update_zeros(self, periods:int):
+        """
+        Add `periods` observations without demand in O(1), like as many calls of update(0).
+        """
+        if not self.fitted:
+            raise RuntimeError("Model not fitted. Call fit method first.")
+        if periods <= 0:
+            return
+        if self._n:
+            self.counts[self._state, 0] += 1
+        self.counts[0, 0] += periods - 1
+        self._state = 0
+        self._n += periods
+
+    def transition_probabilities(self)->np.array:
+        # Probability of demand in the next period for each current state.
+        # A state that was never left falls back to the overall share of periods with demand.
+        totals = self.counts.sum(axis=1)
+        share = self._n_positive / self._n if self._n else 0.0
+        return np.where(totals > 0, self.counts[:, 1] / np.maximum(totals, 1), share)
+
+    def forecast(self, lead_time=1, quantile=0.75, n_samples=1000)->np.array:
+        if not self.fitted:
+            raise RuntimeError("Model not fitted. Call fit method first.")
+        p_demand = self.transition_probabilities()
+        # All sample paths at once, only the lead times are stepped through
+        uniform = self.rng.random((lead_time, n_samples))
+        demand = self._positives[self.rng.integers(0, max(self._n_positive, 1), (lead_time, n_samples))]
+        forecasts = np.zeros((lead_time, n_samples))
+        state = np.full(n_samples, self._state)
+        for step in range(lead_time):
+            state = (uniform[step] < p_demand[state]).astype(int)
+            forecasts[step] = np.where(state == 1, demand[step], 0)
+        return np.quantile(forecasts, quantile, axis=1)
+
+def wss_forecast(df:pd.Series, lead_time=1, quantile=0.75, n_samples=1000, seed=None)->np.array:
+    wss = WSS(seed=seed)
+    wss.fit(df.values)
+    return wss.forecast(lead_time=lead_time, quantile=quantile, n_samples=n_samples)
 
 def naive_predict(df_in: pd.DataFrame, start_date: pd.Timestamp, plot=True) -> pd.DataFrame:
     df = df_in.copy()
@@ -134,23 +311,72 @@ def naive_predict(df_in: pd.DataFrame, start_date: pd.Timestamp, plot=True) -> p
         plt.show()
     return df
 
-def arima_predict(df_in: pd.DataFrame, start_date: pd.Timestamp,plot=True) -> pd.DataFrame:
+def _rolling_blocks(days: pd.Series, target: pd.Series, refit_every: int) -> list:
+    # Row position ranges (start, end) of the target days, grouped into blocks of refit_every days.
+    # Rows are sorted by time, a day is a target if any of its rows is.
+    days = days.to_numpy()
+    day_starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+    day_ends = np.r_[day_starts[1:], len(days)]
+    is_target = np.logical_or.reduceat(target.to_numpy(), day_starts)
+    ranges = list(zip(day_starts[is_target], day_ends[is_target]))
+    return [ranges[i:i + refit_every] for i in range(0, len(ranges), refit_every)]
+
+def _run_blocks(fit_block, data, blocks: list, warm_start: bool, n_jobs: int, **kwargs) -> list:
+    # Forecasts of all blocks in order. Each block is fitted once on the history before its first day.
+    # With warm_start the fit starts from the parameters of the previous block, so the blocks run in sequence.
+    if n_jobs > 1:
+        if warm_start:
+            raise ValueError("warm_start chains the blocks and cannot run with n_jobs > 1")
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            results = list(executor.map(partial(fit_block, data, **kwargs), blocks))
+        return [forecast for forecasts, _ in results for forecast in forecasts]
+    forecasts, params = [], None
+    for block in blocks:
+        block_forecasts, params = fit_block(data, block, init=params if warm_start else None, **kwargs)
+        forecasts.extend(block_forecasts)
+    return forecasts
+
+def _arima_block(values: np.ndarray, block: list, init=None, order=(7, 0, 1)):
+    # Fit on the history before the block, the following days only append their observations
+    model_fit = ARIMA(values[:block[0][0]], order=order).fit(start_params=init)
+    forecasts = []
+    for i, (start, end) in enumerate(block):
+        if i > 0:
+            model_fit = model_fit.append(values[block[i - 1][0]:start])
+        forecasts.append(model_fit.forecast(steps=int(end - start)))
+    return forecasts, model_fit.params
+
+def _prophet_params(model: Prophet) -> dict:
+    # Fitted parameters in the form Stan takes as init
+    params = {name: model.params[name][0][0] for name in ['k', 'm', 'sigma_obs']}
+    params.update({name: model.params[name][0] for name in ['delta', 'beta']})
+    return params
+
+def _prophet_block(history: pd.DataFrame, block: list, init=None):
+    # Fit on the history before the block and forecast all of its days from that fit
+    model = Prophet(daily_seasonality=True)
+    if init is None:
+        model.fit(history.iloc[:block[0][0]])
+    else:
+        model.fit(history.iloc[:block[0][0]], init=init)
+    forecasts = [model.predict(history.iloc[start:end][['ds']])['yhat'].values for start, end in block]
+    return forecasts, _prophet_params(model)
+
+def arima_predict(df_in: pd.DataFrame, start_date: pd.Timestamp,plot=True, refit_every:int=1, warm_start:bool=False, n_jobs:int=1) -> pd.DataFrame:
     df = df_in.copy()
     df['ARIMA_Prediction'] = None
     df['day'] = df['timestamp'].dt.date
-    for target_date in df.loc[df.timestamp >= start_date, 'day'].unique():
-        training_data = df[df.day < target_date]['Day-ahead Price [EUR/MWh]']
+    # Forecast every day from start_date on with the days before it.
+    # The model is refitted every refit_every days, in between the new days are appended to the fitted model.
+    # warm_start starts each refit from the previous parameters, n_jobs fits blocks of days in parallel.
+    values = df['Day-ahead Price [EUR/MWh]'].to_numpy(dtype=float)
+    blocks = _rolling_blocks(df['day'], df.timestamp >= start_date, refit_every)
+    forecasts = _run_blocks(_arima_block, values, blocks, warm_start, n_jobs, order=(7, 0, 1))
 
-        # Fit ARIMA model
-        model = ARIMA(training_data, order=(7, 0, 1)) 
-        model_fit = model.fit()
-
-        # Forecasting the next 24 hours
-        forecast = model_fit.forecast(steps=24)
-
-        # Update predictions in DataFrame
-        forecast_timestamp = pd.date_range(start=target_date, periods=24, freq='H')
-        df.loc[df.day==target_date, 'ARIMA_Prediction'] = forecast.values
+    # Update predictions in DataFrame
+    column = df.columns.get_loc('ARIMA_Prediction')
+    for (start, end), forecast in zip([day for block in blocks for day in block], forecasts):
+        df.iloc[start:end, column] = forecast
     # Plot the predictions vs the actual values
     if plot:
         df[['Day-ahead Price [EUR/MWh]', 'ARIMA_Prediction']].plot(figsize=(20, 6))
@@ -158,20 +384,20 @@ def arima_predict(df_in: pd.DataFrame, start_date: pd.Timestamp,plot=True) -> pd
         plt.show()
     return df
 
-def algo_prophet(price: pd.DataFrame, start_date: pd.Timestamp, plot=True) -> pd.DataFrame:
+def algo_prophet(price: pd.DataFrame, start_date: pd.Timestamp, plot=True, refit_every:int=1, warm_start:bool=False, n_jobs:int=1) -> pd.DataFrame:
     # Prepare data for Prophet
     df = price[['timestamp', 'Day-ahead Price [EUR/MWh]']].copy()
     df.columns = ['ds', 'y']
     df['day'] = df['ds'].dt.date
     df['Prophet_Prediction'] = None
 
-    for target_date in df.loc[df.ds >= start_date, 'day'].unique():
-        model = Prophet(daily_seasonality=True)
-        model.fit(df[df['day'] < target_date])
-        future = model.make_future_dataframe(periods=24, freq='H', include_history=False)
-        forecast = model.predict(future)
-        forecast_timestamp = pd.date_range(start=target_date, periods=24, freq='H')
-        df.loc[df.day==target_date, 'Prophet_Prediction'] = forecast.set_index('ds')['yhat'].values
+    # Refit every refit_every days, the days in between are forecast by the last fit.
+    # warm_start initializes each fit with the previous parameters, n_jobs fits blocks of days in parallel.
+    blocks = _rolling_blocks(df['day'], df.ds >= start_date, refit_every)
+    forecasts = _run_blocks(_prophet_block, df[['ds', 'y']], blocks, warm_start, n_jobs)
+    column = df.columns.get_loc('Prophet_Prediction')
+    for (start, end), forecast in zip([day for block in blocks for day in block], forecasts):
+        df.iloc[start:end, column] = forecast
     # Plot the predictions vs the actual values
     df.columns = ['timestamp', 'Day-ahead Price [EUR/MWh]', 'day', 'Prophet_Prediction']
     if plot:
@@ -179,4 +405,4 @@ def algo_prophet(price: pd.DataFrame, start_date: pd.Timestamp, plot=True) -> pd
         plt.title('Prophet_Prediction---MAE: {:.2f}'.format(np.mean(np.abs(df.loc[df.timestamp >= start_date, 'Day-ahead Price [EUR/MWh]'] - df.loc[df.timestamp >= start_date, 'Prophet_Prediction']))))
         plt.show()
 
-    return df
\ No newline at end of file
+    return df
@@ -1,84 +1,56 @@
 import streamlit as st
-import pandas as pd
-import sqlite3
-import os
+from data_access import CurtailmentStore, get_database_path
 from plot_utils import plot_data, plot_single_plant_weekday, plot_single_plant_hour
-from utils import recalculate_curtailment_power
 
-def create_db_connection(db_name="power_data.db"):
-    db_path = get_database_path(db_name)
-    return sqlite3.connect(db_path)
+@st.cache_resource
+def get_store(db_name="power_data.db"):
+    # One read-only connection and timeline cache shared by all sessions
+    return CurtailmentStore(get_database_path(db_name))
 
 def match_pk_fk(val: int) -> str:
     """ Match the value returned by the pk column in SQLite pragma_table_info() """
     if not show_types or val == 0:
         return ''
-    if val == 1:
+    # pk is the 1-based position within the primary key, composite keys count up from 1
+    if isinstance(val, int) and val >= 1:
         return 'PK'
-    if val == 2:
-        return 'FK'
     raise TypeError(f'Expected type None or int, not {type(val)}, {val =}')
 
-def get_database_path(db_name="power_data.db"):
-    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    db_path = os.path.join(base_dir, "database", db_name)
-    return db_path
-
-def get_data_from_db(query, db_name="power_data.db"):
-    db_path = get_database_path(db_name)
-    with sqlite3.connect(db_path) as conn:
-        return pd.read_sql_query(query, conn)
-
 def prepare_data_for_anlagenschlüssel(anlagenschlüssel, freq="H"):
-    db_path = get_database_path("power_data.db")
-    with sqlite3.connect(db_path) as conn:
-        query = f"""
-        SELECT Start, Ende, nominal_power, curtailment_power 
-        FROM Curtailment 
-        WHERE Anlagenschlüssel = '{anlagenschlüssel}'
-        """
-        df = pd.read_sql_query(query, conn)
-
-    df_timeline = recalculate_curtailment_power(df, freq)
-    return df_timeline
+    return get_store().timeline(anlagenschlüssel, freq)
 
 
 st.title('Curtailment per Anlagenschlüssel')
 
-if 'conn' not in st.session_state:
-    # Initialize 'conn' in session state
-    st.session_state.conn = create_db_connection()
-    
-df_anlagenschlüssel = get_data_from_db("SELECT DISTINCT Anlagenschlüssel FROM Curtailment")
+store = get_store()
 
 # Dropdown to select Anlagenschlüssel and frequency
-selected_anlagenschlüssel = st.selectbox('Select Anlagenschlüssel', df_anlagenschlüssel['Anlagenschlüssel'])
+selected_anlagenschlüssel = st.selectbox('Select Anlagenschlüssel', store.anlagenschlüssel())
 selected_frequency = st.selectbox('Select Time Frequency', ['H', 'T', 'D'])
 
 # Prepare and plot data for the selected Anlagenschlüssel
 if selected_anlagenschlüssel:
-    df_timeline = prepare_data_for_anlagenschlüssel(selected_anlagenschlüssel, freq=selected_frequency)
-    fig = plot_data(df_timeline, selected_anlagenschlüssel)
+    timeline = prepare_data_for_anlagenschlüssel(selected_anlagenschlüssel, freq=selected_frequency)
+    # Narrowing the window redraws it at finer resolution, the figure itself stays downsampled
+    first_slot, last_slot = timeline.slot_times([0, len(timeline) - 1]).to_pydatetime()
+    zoom = st.slider('Zoom', min_value=first_slot, max_value=last_slot, value=(first_slot, last_slot), format='YYYY-MM-DD')
+    fig = plot_data(timeline, selected_anlagenschlüssel, x_range=None if zoom == (first_slot, last_slot) else zoom)
     st.plotly_chart(fig)
-    fig_weekday = plot_single_plant_weekday(df_timeline, selected_anlagenschlüssel)
+    fig_weekday = plot_single_plant_weekday(timeline, selected_anlagenschlüssel)
     st.plotly_chart(fig_weekday)
-    fig_hour = plot_single_plant_hour(df_timeline, selected_anlagenschlüssel)
+    fig_hour = plot_single_plant_hour(timeline, selected_anlagenschlüssel)
     st.plotly_chart(fig_hour)
 
 # sidebar/ schema
 with st.sidebar:
     show_types = st.checkbox('Show types', value=True, help='Show data types for each column ?')
     schema = ''
-    with st.session_state.conn as cursor:
-
-        for x in cursor.execute("SELECT name FROM sqlite_master WHERE type='table'"):
-            table = x[0]
-            schema += f'\n\n * {table}:'
+    for table, columns in store.schema():
+        schema += f'\n\n * {table}:'
 
-            for row in cursor.execute(f"PRAGMA table_info('{table}')"):
-                col_name = row[1]
-                col_type = row[2].upper() if show_types is True else ''
-                schema += f'\n     - {col_name:<15} {col_type} \t {match_pk_fk(row[5])}'
+        for col_name, col_type, pk in columns:
+            col_type = col_type.upper() if show_types is True else ''
+            schema += f'\n     - {col_name:<15} {col_type} \t {match_pk_fk(pk)}'
 
     st.text('DataBase Schema:')
     st.text(schema)
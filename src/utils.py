@@ -1,51 +1,326 @@
+from functools import lru_cache
+import numpy as np
 import pandas as pd
+from scipy import sparse
 
-def generate_complete_timeline(freq="H"):
+# Slot length and the factor converting slot energy (kWh) into average power (kW)
+FREQ_SETTINGS = {
+    "H": (pd.Timedelta(hours=1), 1),
+    "T": (pd.Timedelta(minutes=1), 60),
+    "D": (pd.Timedelta(days=1), 1/24),
+}
+
+DEFAULT_TIMELINE_START = '2021-01-01 00:00:00'
+DEFAULT_TIMELINE_END = '2021-12-31 23:59:59'
+
+@lru_cache(maxsize=32)
+def _timeline_index(start, end, freq):
+    # Slot grids are reused across plants and widget changes, so build each one once
+    return pd.date_range(start=start, end=end, freq=freq)
+
+def timeline_bounds(start, ende):
+    # Whole calendar years covering all Start/Ende intervals
+    first, last = pd.to_datetime(start).min(), pd.to_datetime(ende).max()
+    if pd.isna(first) or pd.isna(last):
+        return pd.Timestamp(DEFAULT_TIMELINE_START), pd.Timestamp(DEFAULT_TIMELINE_END)
+    return pd.Timestamp(first.year, 1, 1), pd.Timestamp(last.year, 12, 31, 23, 59, 59)
+
+def generate_complete_timeline(freq="H", start=DEFAULT_TIMELINE_START, end=DEFAULT_TIMELINE_END):
     # Generate a DataFrame with the specified intervals
-    all_times = pd.date_range(start='2021-01-01 00:00:00', end='2021-12-31 23:59:59', freq=freq).to_series()
+    all_times = _timeline_index(pd.Timestamp(start), pd.Timestamp(end), freq).to_series()
     df_timeline = pd.DataFrame({'TimeSlot': all_times})
 
     return df_timeline
 
-def recalculate_curtailment_power(df,freq="H"):
-    df_timeline = generate_complete_timeline(freq)
-    # Initialize columns for nominal and curtailed power
-    df_timeline['curtailment_power'] = 0
-    df_timeline['curtailment_energy'] = 0
-    df['Start'] = pd.to_datetime(df['Start'])
-    df['Ende'] = pd.to_datetime(df['Ende'])
-    if freq == "H":
-        delta = pd.Timedelta(hours=1)
-        unit_factor = 1
-    elif freq == "T":
-        delta = pd.Timedelta(minutes=1)
-        unit_factor = 60
-    elif freq == "D":
-        delta = pd.Timedelta(days=1)
-        unit_factor = 1/24
-    else:
+def _resolve_bounds(df, start, end):
+    # Explicit bounds win, missing ones are derived from the data
+    if start is None or end is None:
+        data_start, data_end = timeline_bounds(df['Start'], df['Ende'])
+        start = data_start if start is None else start
+        end = data_end if end is None else end
+    return start, end
+
+def _slot_times(df, freq, start, end):
+    start, end = _resolve_bounds(df, start, end)
+    return _timeline_index(pd.Timestamp(start), pd.Timestamp(end), freq)
+
+NAT_NS = np.iinfo(np.int64).min
+
+def _to_ns(values):
+    return pd.to_datetime(values).to_numpy(dtype='datetime64[ns]').view(np.int64)
+
+def _interval_slots(slot_times, start, ende, power, delta):
+    # Map every Start/Ende interval onto the regular slot grid.
+    # A slot counts when Start <= slot <= Ende and receives the energy of
+    # [slot, min(slot + delta, Ende)], matching the original per-row loop.
+    slot_ns = _to_ns(slot_times)
+    start_ns = _to_ns(start)
+    ende_ns = _to_ns(ende)
+    power = np.asarray(power, dtype=np.float64)
+    delta_ns = pd.Timedelta(delta).value
+
+    first = np.searchsorted(slot_ns, start_ns, side='left')
+    last = np.searchsorted(slot_ns, ende_ns, side='right') - 1
+    valid = (start_ns != NAT_NS) & (ende_ns != NAT_NS) & (last >= first) & ~np.isnan(power)
+    # Energy of a fully covered slot and of the last slot, which is cut off at Ende
+    full_energy = power * (delta_ns / 1e9 / 3600)
+    last_duration_ns = np.minimum(slot_ns[np.clip(last, 0, None)] + delta_ns, ende_ns) - slot_ns[np.clip(last, 0, None)]
+    last_energy = power * (last_duration_ns / 1e9 / 3600)
+    return valid, first, last, full_energy, last_energy
+
+def sweep_curtailment_energy(slot_times, start, ende, power, delta, rows=None, n_rows=1):
+    # Spread the energy of all intervals over the slot grid in one pass with a
+    # difference array. `rows` assigns each interval to a row of the result
+    # (e.g. a plant code); without it a single 1D series is returned.
+    n_slots = len(slot_times)
+    squeeze = rows is None
+    valid, first, last, full_energy, last_energy = _interval_slots(slot_times, start, ende, power, delta)
+    rows = np.zeros(len(valid), dtype=np.int64) if squeeze else np.asarray(rows, dtype=np.int64)
+    first, last, full_energy, last_energy = first[valid], last[valid], full_energy[valid], last_energy[valid]
+    offset = rows[valid] * (n_slots + 1)
+    size = n_rows * (n_slots + 1)
+
+    # Every slot before the last one of an interval is fully covered
+    diff = np.bincount(offset + first, weights=full_energy, minlength=size)
+    diff -= np.bincount(offset + last, weights=full_energy, minlength=size)
+    active = np.bincount(offset + first, minlength=size) - np.bincount(offset + last + 1, minlength=size)
+    energy = np.cumsum(diff.reshape(n_rows, n_slots + 1), axis=1)[:, :n_slots]
+    # Drop floating point residue of the running sum outside of any interval
+    energy[np.cumsum(active.reshape(n_rows, n_slots + 1), axis=1)[:, :n_slots] == 0] = 0
+    np.add.at(energy, (rows[valid], last), last_energy)
+    return energy[0] if squeeze else energy
+
+def sweep_curtailment_energy_sparse(slot_times, start, ende, power, delta, rows, n_rows):
+    # Same as sweep_curtailment_energy but builds a CSR matrix from the covered
+    # slots only, so memory scales with curtailed slots instead of rows x slots.
+    n_slots = len(slot_times)
+    valid, first, last, full_energy, last_energy = _interval_slots(slot_times, start, ende, power, delta)
+    rows = np.asarray(rows, dtype=np.int64)[valid]
+    first, last, full_energy, last_energy = first[valid], last[valid], full_energy[valid], last_energy[valid]
+
+    counts = last - first + 1
+    ends = np.cumsum(counts)
+    within = np.arange(ends[-1] if len(ends) else 0) - np.repeat(ends - counts, counts)
+    values = np.repeat(full_energy, counts)
+    values[ends - 1] = last_energy
+    energy = sparse.coo_matrix(
+        (values, (np.repeat(rows, counts), np.repeat(first, counts) + within)),
+        shape=(n_rows, n_slots),
+    )
+    # Duplicate (row, slot) entries of overlapping intervals are summed here
+    energy = energy.tocsr()
+    energy.eliminate_zeros()
+    energy.sort_indices()
+    return energy
+
+def recalculate_curtailment_power(df,freq="H", start=None, end=None):
+    if freq not in FREQ_SETTINGS:
         print("freq should be H or D or T")
         return
-    # Iterate over each row in the original dataframe
-    for _, row in df.iterrows():
-        # Find overlapping time slots
-        overlapping_times = df_timeline[(df_timeline['TimeSlot'] >= row['Start']) & (df_timeline['TimeSlot'] <= row['Ende'])]
-
-        # Calculate curtailment for each overlapping time slot
-        for time_slot in overlapping_times['TimeSlot']:
-            duration = min(time_slot + delta, row['Ende']) - max(time_slot, row['Start'])
-            duration_hours = duration.total_seconds() / 3600
-            curtailment_energy = row['curtailment_power'] * duration_hours
-            # Update timeline DataFrame
-            df_timeline.loc[df_timeline['TimeSlot'] == time_slot, 'curtailment_energy'] += curtailment_energy
+    delta, unit_factor = FREQ_SETTINGS[freq]
+    df_timeline = generate_complete_timeline(freq, *_resolve_bounds(df, start, end))
+    df_timeline['curtailment_energy'] = sweep_curtailment_energy(
+        df_timeline['TimeSlot'], df['Start'], df['Ende'], df['curtailment_power'], delta)
     df_timeline['curtailment_power'] = df_timeline['curtailment_energy']*unit_factor
     # Calculate cumulative curtailed energy
     df_timeline['cumulative_energy'] = df_timeline['curtailment_energy'].cumsum()
+    # Keep the column order of the timeline
+    return df_timeline[['TimeSlot', 'curtailment_power', 'curtailment_energy', 'cumulative_energy']]
 
-    return df_timeline
+def recalculate_curtailment_energy_matrix(df, freq="H", anlagenschlüssel=None, sparse_output=False, start=None, end=None):
+    # Batched counterpart of recalculate_curtailment_power for many plants at once.
+    # Returns the plant keys, the slot times and a plant x slot matrix of
+    # curtailment energy (kWh), dense or scipy CSR.
+    if freq not in FREQ_SETTINGS:
+        print("freq should be H or D or T")
+        return
+    delta, _ = FREQ_SETTINGS[freq]
+    if anlagenschlüssel is not None:
+        df = df[df['Anlagenschlüssel'].isin(list(anlagenschlüssel))]
+    df = df[df['Anlagenschlüssel'].notna()]
+    plant_codes, plant_keys = pd.factorize(df['Anlagenschlüssel'], sort=True)
+    slot_times = _slot_times(df, freq, start, end)
+    sweep = sweep_curtailment_energy_sparse if sparse_output else sweep_curtailment_energy
+    energy = sweep(slot_times, df['Start'], df['Ende'], df['curtailment_power'], delta,
+                   rows=plant_codes, n_rows=len(plant_keys))
+    return plant_keys, slot_times, energy
 
-def prepare_data_for_anlagenschlüssel_df(df, anlagenschlüssel, freq="H"):
+def aggregate_curtailment_energy(energy, plant_keys, plant_groups):
+    # Sum the rows of a plant x slot matrix into groups such as network areas (Gebiet).
+    # `plant_groups` maps Anlagenschlüssel to its group.
+    group_codes, group_keys = pd.factorize(pd.Series(plant_keys).map(plant_groups), sort=True)
+    keep = group_codes >= 0
+    indicator = sparse.csr_matrix(
+        (np.ones(keep.sum()), (group_codes[keep], np.flatnonzero(keep))),
+        shape=(len(group_keys), len(plant_keys)),
+    )
+    return group_keys, indicator @ energy
+
+def prepare_data_for_anlagenschlüssel_df(df, anlagenschlüssel, freq="H", start=None, end=None):
     df_single_anlagenschlüssel = df[df['Anlagenschlüssel'] == anlagenschlüssel]
     # Generate complete timeline and calculate power
-    df_timeline = recalculate_curtailment_power(df_single_anlagenschlüssel, freq)
-    return df_timeline
\ No newline at end of file
+    df_timeline = recalculate_curtailment_power(df_single_anlagenschlüssel, freq, start, end)
+    return df_timeline
+
+# Number of buckets of each profile; weekday_hour is weekday * 24 + hour
+PROFILE_BUCKETS = {'hour': 24, 'weekday': 7, 'weekday_hour': 168}
+# Period after which the buckets of each profile repeat
+PROFILE_PERIODS = {'hour': pd.Timedelta(days=1), 'weekday': pd.Timedelta(weeks=1), 'weekday_hour': pd.Timedelta(weeks=1)}
+
+def slot_profile_codes(slot_times):
+    # Bucket code of every slot for each profile, from the int64 nanoseconds of naive timestamps
+    slot_ns = slot_times if isinstance(slot_times, np.ndarray) and slot_times.dtype == np.int64 else _to_ns(slot_times)
+    hour = (slot_ns // 3_600_000_000_000) % 24
+    # 1970-01-01 was a Thursday (weekday 3)
+    weekday = (slot_ns // 86_400_000_000_000 + 3) % 7
+    return {'hour': hour, 'weekday': weekday, 'weekday_hour': weekday * 24 + hour}
+
+def _profile_code(slot_ns, by):
+    # Bucket code of one profile
+    return slot_profile_codes(slot_ns)[by]
+
+def _bucket_mean(total, count):
+    # NaN for buckets without slots, like a groupby that never sees them
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, total / np.maximum(count, 1), np.nan)
+
+def profile_statistics(values, slot_times, quantiles=()):
+    # Hour, weekday and weekday x hour means (and optional quantiles) of a timeline.
+    # values is a 1D series over slot_times or a rows x slots array / CSR matrix, e.g.
+    # from recalculate_curtailment_energy_matrix, so all plants are handled at once.
+    # Returns {profile: {'mean' | quantile: array of shape (rows, buckets)}}, 1D for 1D input.
+    squeeze = np.ndim(values) == 1
+    if squeeze:
+        values = np.asarray(values, dtype=np.float64)[np.newaxis, :]
+    codes = slot_profile_codes(slot_times)
+    n_slots = len(codes['hour'])
+    # One pass: sum per weekday x hour through a slot -> bucket indicator matrix,
+    # the hour and weekday sums are folded from it
+    indicator = sparse.csr_matrix(
+        (np.ones(n_slots), (np.arange(n_slots), codes['weekday_hour'])),
+        shape=(n_slots, PROFILE_BUCKETS['weekday_hour']),
+    )
+    sums = values @ indicator
+    sums = (sums.toarray() if sparse.issparse(sums) else np.asarray(sums)).reshape(-1, 7, 24)
+    counts = np.bincount(codes['weekday_hour'], minlength=PROFILE_BUCKETS['weekday_hour']).reshape(7, 24)
+    stats = {
+        'hour': {'mean': _bucket_mean(sums.sum(axis=1), counts.sum(axis=0))},
+        'weekday': {'mean': _bucket_mean(sums.sum(axis=2), counts.sum(axis=1))},
+        'weekday_hour': {'mean': _bucket_mean(sums.reshape(-1, 168), counts.reshape(168))},
+    }
+    if quantiles:
+        for profile, n_buckets in PROFILE_BUCKETS.items():
+            order = np.argsort(codes[profile], kind='stable')
+            bounds = np.r_[0, np.cumsum(np.bincount(codes[profile], minlength=n_buckets))]
+            result = np.full((len(quantiles), values.shape[0], n_buckets), np.nan)
+            for bucket in range(n_buckets):
+                if bounds[bucket + 1] > bounds[bucket]:
+                    block = values[:, order[bounds[bucket]:bounds[bucket + 1]]]
+                    block = block.toarray() if sparse.issparse(block) else block
+                    result[:, :, bucket] = np.quantile(block, quantiles, axis=1)
+            for q, value in zip(quantiles, result):
+                stats[profile][q] = value
+    if squeeze:
+        stats = {profile: {stat: value[0] for stat, value in profile_stats.items()} for profile, profile_stats in stats.items()}
+    return stats
+
+class CompactTimeline:
+    """
+    Curtailment timeline stored as (slot index, energy) pairs of the non-zero slots
+    on an implicit regular grid of `n_slots` slots starting at `start`.
+
+    Values are float32 kWh per slot; the dense timeline is only built by `to_frame`.
+    """
+
+    def __init__(self, start, freq, n_slots, slot_index, energy):
+        self.start = pd.Timestamp(start)
+        self.freq = freq
+        self.n_slots = n_slots
+        self.slot_index = np.asarray(slot_index, dtype=np.int32)
+        self.energy = np.asarray(energy, dtype=np.float32)
+        self.delta, self.unit_factor = FREQ_SETTINGS[freq]
+
+    @classmethod
+    def from_curtailment(cls, df, freq="H", start=None, end=None):
+        delta, _ = FREQ_SETTINGS[freq]
+        slot_times = _slot_times(df, freq, start, end)
+        energy = sweep_curtailment_energy_sparse(slot_times, df['Start'], df['Ende'], df['curtailment_power'],
+                                                 delta, rows=np.zeros(len(df)), n_rows=1)
+        return cls.from_csr_row(energy, 0, slot_times[0], freq)
+
+    @classmethod
+    def from_slots(cls, slot_times, energy, freq="H", start=None, end=None):
+        # Wrap pre-aggregated (slot time, energy) pairs, e.g. rows of CurtailmentRollup;
+        # missing bounds cover the years of the slots
+        slot_times = pd.to_datetime(slot_times)
+        start, end = _resolve_bounds(pd.DataFrame({'Start': slot_times, 'Ende': slot_times}), start, end)
+        grid = _timeline_index(pd.Timestamp(start), pd.Timestamp(end), freq)
+        slot_index = grid.get_indexer(slot_times)
+        keep = slot_index >= 0
+        order = np.argsort(slot_index[keep], kind='stable')
+        return cls(grid[0], freq, len(grid), slot_index[keep][order], np.asarray(energy)[keep][order])
+
+    @classmethod
+    def from_csr_row(cls, energy, row, start, freq):
+        # Wrap one row of the sparse matrix of recalculate_curtailment_energy_matrix
+        row_slice = slice(energy.indptr[row], energy.indptr[row + 1])
+        return cls(start, freq, energy.shape[1], energy.indices[row_slice], energy.data[row_slice])
+
+    def __len__(self):
+        return self.n_slots
+
+    @property
+    def nbytes(self):
+        return self.slot_index.nbytes + self.energy.nbytes
+
+    @property
+    def power(self):
+        return self.energy * np.float32(self.unit_factor)
+
+    def slot_times(self, slot_index=None):
+        slot_index = self.slot_index if slot_index is None else np.asarray(slot_index)
+        return self.start + pd.to_timedelta(slot_index * self.delta.value, unit='ns')
+
+    def total_energy(self):
+        return float(self.energy.sum(dtype=np.float64))
+
+    def line_points(self):
+        # Points that draw the same line as the dense timeline: every non-zero slot
+        # plus the zero slot right before and after each run of non-zero slots.
+        neighbours = np.concatenate([self.slot_index - 1, self.slot_index, self.slot_index + 1, [0, self.n_slots - 1]])
+        idx = np.unique(neighbours[(neighbours >= 0) & (neighbours < self.n_slots)])
+        pos = np.searchsorted(self.slot_index, idx)
+        hit = np.isin(idx, self.slot_index)
+        energy = np.zeros(len(idx))
+        energy[hit] = self.energy[pos[hit]]
+        cumulative = np.concatenate([[0], np.cumsum(self.energy, dtype=np.float64)])[pos + hit]
+        return pd.DataFrame({
+            'TimeSlot': self.slot_times(idx),
+            'curtailment_power': energy * self.unit_factor,
+            'cumulative_energy': cumulative,
+        })
+
+    def profile_mean(self, by="hour"):
+        # Mean curtailment power per profile bucket over all slots, zeros included;
+        # only the curtailed slots are summed
+        if by not in PROFILE_BUCKETS:
+            raise ValueError(f"Invalid profile specified. Use one of {list(PROFILE_BUCKETS)}.")
+        # Slots per bucket from one period of the grid: whole periods plus the leading part of the next
+        period = PROFILE_PERIODS[by] // self.delta
+        codes = _profile_code(self.start.value + np.arange(min(self.n_slots, period), dtype=np.int64) * self.delta.value, by)
+        full_periods, rest = divmod(self.n_slots, period)
+        slot_count = full_periods * np.bincount(codes, minlength=PROFILE_BUCKETS[by]) + np.bincount(codes[:rest], minlength=PROFILE_BUCKETS[by])
+        event_ns = self.start.value + self.slot_index.astype(np.int64) * self.delta.value
+        power_sum = np.bincount(_profile_code(event_ns, by), weights=self.power, minlength=PROFILE_BUCKETS[by])
+        return _bucket_mean(power_sum, slot_count)
+
+    def to_frame(self):
+        # Dense timeline with the columns of recalculate_curtailment_power
+        energy = np.zeros(self.n_slots)
+        energy[self.slot_index] = self.energy
+        times = self.slot_times(np.arange(self.n_slots))
+        df_timeline = pd.DataFrame({'TimeSlot': times}, index=times)
+        df_timeline['curtailment_power'] = energy * self.unit_factor
+        df_timeline['curtailment_energy'] = energy
+        df_timeline['cumulative_energy'] = df_timeline['curtailment_energy'].cumsum()
+        return df_timeline